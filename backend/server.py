@@ -1,33 +1,295 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pyinstrument import Profiler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, Field, EmailStr, field_validator, model_validator
+from typing import List, Literal, Optional
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import bcrypt
+import httpx
 import jwt
+import orjson
 from bson import ObjectId
 import asyncio
+import base64
+import calendar
+import heapq
+import hmac
+import ipaddress
+import json
+import math
+import random
+import string
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# ==================== METRICS ====================
+
+REQUEST_COUNT = Counter('http_requests_total', 'HTTP requests', ['method', 'route', 'status'])
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency', ['method', 'route', 'status'])
+REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests being served')
+MONGO_COMMAND_LATENCY = Histogram(
+    'mongo_command_duration_seconds', 'MongoDB command latency', ['collection', 'command', 'outcome'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+)
+MONGO_POOL_CONNECTIONS = Gauge('mongo_pool_connections', 'Open MongoDB connections')
+MONGO_POOL_CHECKED_OUT = Gauge('mongo_pool_checked_out', 'MongoDB connections in use')
+PUSH_NOTIFICATIONS = Counter('push_notifications_total', 'Push messages by outcome', ['outcome'])
+PUSH_RETRIES = Counter('push_retries_total', 'Push batches sent again after a failure')
+PUSH_BATCH_SIZE_HISTOGRAM = Histogram(
+    'push_batch_size', 'Messages per push API call', buckets=(1, 5, 10, 25, 50, 75, 100)
+)
+PUSH_SEND_LATENCY = Histogram(
+    'push_send_duration_seconds', 'Push API call latency',
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+)
+PUSH_DELIVERY_LATENCY = Histogram(
+    'push_delivery_duration_seconds', 'Time from a reminder firing to the push API accepting it',
+    buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+)
+OUTBOX_EVENTS = Counter('outbox_events_total', 'Outbox events by kind and outcome', ['kind', 'outcome'])
+OUTBOX_LAG = Histogram(
+    'outbox_lag_seconds', 'Time from recording an outbox event to applying it',
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+)
+RATE_LIMITED_REQUESTS = Counter('rate_limited_requests_total', 'Requests rejected with 429', ['route'])
+EVENT_LOOP_LAG = Gauge('event_loop_lag_seconds', 'Most recent event loop scheduling delay')
+EVENT_LOOP_LAG_HISTOGRAM = Histogram(
+    'event_loop_lag_distribution_seconds', 'Event loop scheduling delay',
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1)
+)
+EVENT_LOOP_LAG_INTERVAL = 0.5
+event_loop_stats = {'lag_seconds': 0.0}
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command by collection and command name"""
+
+    def __init__(self):
+        self._collections = {}  # request_id -> collection
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self._collections[event.request_id] = collection if isinstance(collection, str) else ''
+
+    def _finished(self, event, outcome):
+        collection = self._collections.pop(event.request_id, '')
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name, outcome).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._finished(event, 'success')
+
+    def failed(self, event):
+        self._finished(event, 'failure')
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Tracks open, checked-out and waiting connections of the MongoDB pool"""
+
+    def __init__(self):
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.open += 1
+        MONGO_POOL_CONNECTIONS.inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.open -= 1
+        MONGO_POOL_CONNECTIONS.dec()
+
+    def connection_check_out_started(self, event):
+        self.waiting += 1
+
+    def connection_check_out_failed(self, event):
+        self.waiting -= 1
+
+    def connection_checked_out(self, event):
+        self.waiting -= 1
+        self.checked_out += 1
+        MONGO_POOL_CHECKED_OUT.inc()
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+        MONGO_POOL_CHECKED_OUT.dec()
+
+class MetricsMiddleware:
+    """Counts and times every request by method, route template and status"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # The route template keeps label cardinality bounded
+            route = scope.get('route')
+            route_path = route.path if route is not None else 'unmatched'
+            REQUEST_COUNT.labels(scope['method'], route_path, status).inc()
+            REQUEST_LATENCY.labels(scope['method'], route_path, status).observe(time.perf_counter() - start)
+
+async def monitor_event_loop_lag():
+    """Measure how late the event loop wakes a sleeping task"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        lag = max(time.perf_counter() - start - EVENT_LOOP_LAG_INTERVAL, 0)
+        event_loop_stats['lag_seconds'] = lag
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
+
+# ==================== PROFILING ====================
+
+# Fraction of requests profiled at random; 0 disables sampling
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+# Requests sending this value in X-Profile are always profiled; unset disables the header
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+# Directory for HTML flame views, one sub-directory per route; unset only logs a summary
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '')
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL_SECONDS', '0.001'))
+
+profile_logger = logging.getLogger('server.profile')
+
+class ProfilingMiddleware:
+    """Runs sampled or explicitly requested requests under pyinstrument.
+
+    Only installed when PROFILE_SAMPLE_RATE or PROFILE_TOKEN is set, so it
+    costs nothing otherwise. One request is profiled at a time; the output
+    is rendered off the event loop after the response has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._active = False
+
+    def _wanted(self, scope) -> bool:
+        if PROFILE_TOKEN:
+            for name, value in scope['headers']:
+                if name == b'x-profile':
+                    return hmac.compare_digest(value.decode('latin-1'), PROFILE_TOKEN)
+        return random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or self._active or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self._active = True
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode='enabled')
+        profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+            self._active = False
+            route = scope.get('route')
+            route_path = route.path if route is not None else 'unmatched'
+            await asyncio.to_thread(self._record, scope['method'], route_path, profiler)
+
+    def _record(self, method: str, route_path: str, profiler):
+        profile_logger.info(f"Profile of {method} {route_path}\n{profiler.output_text(show_all=False)}")
+        if PROFILE_DIR:
+            slug = f"{method}{route_path}".replace('/', '_').replace('{', '').replace('}', '')
+            directory = Path(PROFILE_DIR) / slug
+            directory.mkdir(parents=True, exist_ok=True)
+            filename = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}.html"
+            (directory / filename).write_text(profiler.output_html())
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+# 0 means no limit for the socket read and pool wait timeouts
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '0'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '0'))
+mongo_pool_metrics = MongoPoolMetrics()
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS or None,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+    event_listeners=[MongoCommandMetrics(), mongo_pool_metrics]
+)
 db = client[os.environ['DB_NAME']]
 
 # JWT Settings
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
+ACCESS_TOKEN_TTL_MINUTES = int(os.environ.get('ACCESS_TOKEN_TTL_MINUTES', '15'))
+REFRESH_TOKEN_TTL_DAYS = int(os.environ.get('REFRESH_TOKEN_TTL_DAYS', '30'))
+
+# ==================== SERIALIZATION ====================
+
+def orjson_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered by orjson.
+
+    orjson writes datetimes exactly as datetime.isoformat() does and
+    ObjectIds are rendered as strings, so handlers can return documents
+    without converting fields by hand. Returning one of these directly from
+    a handler also skips FastAPI's jsonable_encoder pass.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=orjson_default)
 
 # Create the main app
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # ==================== MODELS ====================
@@ -47,6 +309,13 @@ class GoogleAuthRequest(BaseModel):
     email: EmailStr
     name: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+    device_token: Optional[str] = None  # push token to stop sending to
+
 class UserResponse(BaseModel):
     id: str
     name: str
@@ -55,11 +324,49 @@ class UserResponse(BaseModel):
     plan_expiry: Optional[datetime]
     reminder_count: int
 
+class RecurrenceRule(BaseModel):
+    """Subset of an iCalendar RRULE; the reminder's date_time is the first occurrence"""
+    freq: Literal['daily', 'weekly', 'monthly']
+    interval: int = Field(1, ge=1, le=366)
+    by_weekday: Optional[List[int]] = None  # weekly only; 0 = Monday
+    until: Optional[datetime] = None
+    count: Optional[int] = Field(None, ge=1)
+
+    @model_validator(mode='after')
+    def check_rule(self):
+        if self.until is not None and self.count is not None:
+            raise ValueError("Set either until or count, not both")
+        if self.by_weekday is not None:
+            if self.freq != 'weekly':
+                raise ValueError("by_weekday only applies to weekly recurrence")
+            if not self.by_weekday or any(day < 0 or day > 6 for day in self.by_weekday):
+                raise ValueError("by_weekday must list weekdays from 0 (Monday) to 6 (Sunday)")
+        return self
+
+def check_timezone(value: Optional[str]) -> Optional[str]:
+    if value is not None:
+        try:
+            get_zone(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown timezone: {value}")
+    return value
+
 class ReminderCreate(BaseModel):
     name_to_call: str
     phone_number: str
     description: Optional[str] = ""
-    date_time: datetime
+    date_time: datetime  # wall-clock time in `timezone` when it has no offset
+    timezone: Optional[str] = None  # IANA name, e.g. "Asia/Kolkata"
+    recurrence: Optional[RecurrenceRule] = None
+
+    _check_timezone = field_validator('timezone')(check_timezone)
+
+class ReminderReschedule(BaseModel):
+    """New first occurrence; an omitted timezone keeps the stored one, null clears it"""
+    date_time: datetime  # wall-clock time in the reminder's timezone when it has no offset
+    timezone: Optional[str] = None
+
+    _check_timezone = field_validator('timezone')(check_timezone)
 
 class ReminderUpdate(BaseModel):
     name_to_call: Optional[str]
@@ -68,6 +375,14 @@ class ReminderUpdate(BaseModel):
     date_time: Optional[datetime]
     status: Optional[str]
 
+REMINDER_BATCH_MAX = int(os.environ.get('REMINDER_BATCH_MAX', '100'))
+
+class ReminderBatchCreate(BaseModel):
+    reminders: List[ReminderCreate] = Field(min_length=1, max_length=REMINDER_BATCH_MAX)
+
+class ReminderBatchIds(BaseModel):
+    ids: List[str] = Field(min_length=1, max_length=REMINDER_BATCH_MAX)
+
 class ReminderResponse(BaseModel):
     id: str
     user_id: str
@@ -78,6 +393,13 @@ class ReminderResponse(BaseModel):
     status: str
     created_at: datetime
 
+class DeviceTokenRegister(BaseModel):
+    token: str = Field(min_length=1, max_length=255)  # Expo push token
+    platform: Optional[Literal['ios', 'android', 'web']] = None
+
+class DeviceTokenRemove(BaseModel):
+    token: str
+
 class PaymentVerify(BaseModel):
     order_id: str
     payment_id: str
@@ -88,113 +410,2016 @@ class PaymentOrder(BaseModel):
     amount: int
     plan_type: str
 
+# ==================== USER CACHE ====================
+
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+
+class UserCache:
+    """Bounded LRU cache of user documents with a TTL, keyed by user id.
+
+    Every write to a user document must call invalidate(), which moves that
+    user to a new generation. A lookup is stored only if its user is still
+    at the generation it started at, so a stale read can never be cached
+    over a newer write, while writes to other users do not turn it away.
+    The TTL bounds staleness from other workers.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()  # user_id -> (expires_at, user)
+        self._generations = OrderedDict()  # user_id -> generation of its last invalidation
+        self._counter = 0
+        # Generation of users whose entry was dropped; at least their last one
+        self._floor = 0
+        self.hits = 0
+        self.misses = 0
+
+    def epoch(self, user_id: str) -> int:
+        return self._generations.get(user_id, self._floor)
+
+    def get(self, user_id: str):
+        item = self._items.get(user_id)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._items[user_id]
+            self.misses += 1
+            return None
+        self._items.move_to_end(user_id)
+        self.hits += 1
+        return item[1]
+
+    def set(self, user_id: str, user: dict, epoch: int):
+        """Store a user read while that user was at the given epoch"""
+        if epoch != self.epoch(user_id) or self.max_size <= 0:
+            return
+        self._items[user_id] = (time.monotonic() + self.ttl, user)
+        self._items.move_to_end(user_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        self._counter += 1
+        self._generations[user_id] = self._counter
+        self._generations.move_to_end(user_id)
+        while len(self._generations) > max(self.max_size, 1):
+            _, generation = self._generations.popitem(last=False)
+            self._floor = max(self._floor, generation)
+        self._items.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {'size': len(self._items), 'hits': self.hits, 'misses': self.misses}
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+
+# ==================== TOKEN REVOCATION ====================
+
+# How often each worker pulls revocations made by the other workers
+REVOCATION_SYNC_SECONDS = int(os.environ.get('REVOCATION_SYNC_SECONDS', '30'))
+
+class TokenRevocationList:
+    """Revoked token ids and per-user plan version floors, kept in memory.
+
+    Every entry is written through to the revoked_tokens collection and other
+    workers pull it in with sync(). An entry lives only as long as a token it
+    applies to could still be valid, so the list stays small. A plan version
+    floor rejects access tokens whose `pv` claim predates a plan change, which
+    makes the client refresh and pick up the new plan claims.
+    """
+
+    def __init__(self):
+        self._tokens = {}  # jti -> expires_at
+        self._plan_versions = {}  # user_id -> (lowest accepted plan version, expires_at)
+        self._synced_at = None
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._tokens
+
+    def is_outdated(self, user_id: str, plan_version: int) -> bool:
+        floor = self._plan_versions.get(user_id)
+        return floor is not None and plan_version < floor[0]
+
+    def _set_floor(self, user_id: str, plan_version: int, expires_at: datetime):
+        current = self._plan_versions.get(user_id)
+        if current is None or plan_version >= current[0]:
+            self._plan_versions[user_id] = (plan_version, expires_at)
+
+    async def revoke(self, jti: str, user_id: str, expires_at: datetime):
+        """Reject a token from now until it would have expired anyway"""
+        self._tokens[jti] = expires_at
+        await db.revoked_tokens.update_one(
+            {'_id': jti},
+            {'$set': {'user_id': user_id, 'expires_at': expires_at, 'revoked_at': datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def outdate_plan_claims(self, plan_versions: dict):
+        """Reject access tokens issued before each user's plan moved to the given version"""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(minutes=ACCESS_TOKEN_TTL_MINUTES)
+        for user_id, plan_version in plan_versions.items():
+            self._set_floor(user_id, plan_version, expires_at)
+        if plan_versions:
+            await db.revoked_tokens.bulk_write([
+                UpdateOne(
+                    {'_id': f'pv:{user_id}'},
+                    {'$max': {'plan_version': plan_version},
+                     '$set': {'user_id': user_id, 'expires_at': expires_at, 'revoked_at': now}},
+                    upsert=True
+                )
+                for user_id, plan_version in plan_versions.items()
+            ], ordered=False)
+
+    async def sync(self):
+        """Pull in entries written since the last sync and drop expired ones"""
+        now = datetime.utcnow()
+        query = {'expires_at': {'$gt': now}}
+        if self._synced_at is not None:
+            # Overlap the previous window a little to allow for clock skew between workers
+            query['revoked_at'] = {'$gte': self._synced_at - timedelta(seconds=5)}
+        async for doc in db.revoked_tokens.find(query):
+            if 'plan_version' in doc:
+                self._set_floor(doc['user_id'], doc['plan_version'], doc['expires_at'])
+            else:
+                self._tokens[doc['_id']] = doc['expires_at']
+        self._synced_at = now
+        
+        self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp > now}
+        self._plan_versions = {uid: floor for uid, floor in self._plan_versions.items() if floor[1] > now}
+
+    def stats(self) -> dict:
+        return {
+            'revoked_tokens': len(self._tokens),
+            'plan_version_floors': len(self._plan_versions),
+            'last_sync': self._synced_at.isoformat() if self._synced_at else None
+        }
+
+revocation_list = TokenRevocationList()
+
+# ==================== RATE LIMITING ====================
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+# Buckets kept per worker; the least recently used are dropped beyond this
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+RATE_LIMIT_SHARDS = 16
+# How often consumption is exchanged with other workers through MongoDB; 0 keeps limits per worker
+RATE_LIMIT_SYNC_SECONDS = int(os.environ.get('RATE_LIMIT_SYNC_SECONDS', '0'))
+# Proxies (comma-separated addresses or CIDRs) whose X-Forwarded-For names the client
+RATE_LIMIT_TRUSTED_PROXIES = [
+    ipaddress.ip_network(cidr.strip(), strict=False)
+    for cidr in os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '').split(',') if cidr.strip()
+]
+# Per-IP limits; behind an ingress with no trusted proxies every client would
+# share the ingress address and one bucket, so they are off until proxies are
+# set. A service reached directly by clients sets this to true.
+RATE_LIMIT_IP_ENABLED = os.environ.get(
+    'RATE_LIMIT_IP_ENABLED', 'true' if RATE_LIMIT_TRUSTED_PROXIES else 'false'
+).lower() == 'true'
+
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in RATE_LIMIT_TRUSTED_PROXIES)
+
+def client_ip(request: Request) -> str:
+    """Address of the client, looking through X-Forwarded-For added by trusted proxies.
+
+    The header is read from the right, skipping the trusted hops, so a client
+    cannot pick its address by sending its own X-Forwarded-For.
+    """
+    address = request.client.host if request.client else 'unknown'
+    if not is_trusted_proxy(address):
+        return address
+    forwarded = request.headers.get('x-forwarded-for', '')
+    for hop in reversed([hop.strip() for hop in forwarded.split(',') if hop.strip()]):
+        address = hop
+        if not is_trusted_proxy(hop):
+            break
+    return address
+
+# Route -> [(identity, burst, requests per minute)]; every listed bucket must have a token
+RATE_LIMIT_POLICIES = {
+    'login': [('ip', 20, 20), ('email', 5, 5)],
+    'register': [('ip', 5, 5)],
+    # Devices poll once a minute; leave room for several devices per account
+    'reminders_check': [('user', 30, 30)],
+    'referral_validate': [('ip', 10, 10)],
+}
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated_at', 'idle_after', 'pending', 'seen_total')
+
+    def __init__(self, capacity: float, now: float, idle_after: float):
+        self.tokens = capacity
+        self.updated_at = now
+        self.idle_after = idle_after  # seconds after which the bucket is full again
+        self.pending = 0  # tokens taken since the last sync
+        self.seen_total = None  # cluster-wide tokens taken, as of the last sync
+
+class RateLimiter:
+    """Token buckets keyed by route, identity and value, split over LRU shards.
+
+    A bucket is refilled lazily when it is touched, so a check is O(1). Each
+    shard is bounded, and the oldest bucket of a shard is dropped once it has
+    been idle long enough to be full again, since a full bucket and a missing
+    one behave the same. With sync() workers add up what they took per bucket
+    in the rate_limits collection and charge each other's share locally, so
+    the limits hold across replicas to within one sync interval.
+    """
+
+    def __init__(self, policies: dict, max_keys: int, shards: int):
+        self.policies = policies
+        self._shards = [OrderedDict() for _ in range(shards)]
+        self._shard_size = max(max_keys // shards, 1)
+        self._pending = set()  # keys with tokens taken since the last sync
+
+    def _bucket(self, key: str, capacity: float, rate: float, now: float) -> TokenBucket:
+        shard = self._shards[hash(key) % len(self._shards)]
+        bucket = shard.get(key)
+        if bucket is None:
+            bucket = shard[key] = TokenBucket(capacity, now, capacity / rate)
+            if len(shard) > self._shard_size:
+                shard.popitem(last=False)
+        else:
+            bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated_at) * rate)
+            bucket.updated_at = now
+            shard.move_to_end(key)
+        
+        # Expire at most one idle bucket per call to keep the cost constant
+        oldest_key, oldest = next(iter(shard.items()))
+        if oldest is not bucket and not oldest.pending and now - oldest.updated_at > oldest.idle_after:
+            del shard[oldest_key]
+        return bucket
+
+    def check(self, route: str, request: Request, **identities):
+        """Take a token from every bucket of the route's policy; 429 when one is empty"""
+        if not RATE_LIMIT_ENABLED:
+            return
+        now = time.monotonic()
+        if RATE_LIMIT_IP_ENABLED:
+            identities['ip'] = client_ip(request)
+        
+        retry_after = 0.0
+        for identity, burst, per_minute in self.policies[route]:
+            value = identities.get(identity)
+            if value is None:
+                continue
+            key = f'{route}:{identity}:{value}'
+            rate = per_minute / 60
+            bucket = self._bucket(key, burst, rate, now)
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                if RATE_LIMIT_SYNC_SECONDS:
+                    bucket.pending += 1
+                    self._pending.add(key)
+            else:
+                retry_after = max(retry_after, (1 - bucket.tokens) / rate)
+        
+        if retry_after:
+            RATE_LIMITED_REQUESTS.labels(route).inc()
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests. Please try again later.",
+                headers={'Retry-After': str(math.ceil(retry_after))}
+            )
+
+    def _find(self, key: str) -> Optional[TokenBucket]:
+        return self._shards[hash(key) % len(self._shards)].get(key)
+
+    async def sync(self):
+        """Publish tokens taken here and charge the ones other workers took"""
+        keys, self._pending = self._pending, set()
+        buckets = {key: bucket for key in keys if (bucket := self._find(key)) and bucket.pending}
+        if not buckets:
+            return
+        
+        now = datetime.utcnow()
+        taken = {key: bucket.pending for key, bucket in buckets.items()}
+        for bucket in buckets.values():
+            bucket.pending = 0
+        await db.rate_limits.bulk_write([
+            UpdateOne(
+                {'_id': key},
+                {'$inc': {'taken': count},
+                 '$set': {'expires_at': now + timedelta(seconds=buckets[key].idle_after)}},
+                upsert=True
+            )
+            for key, count in taken.items()
+        ], ordered=False)
+        
+        async for doc in db.rate_limits.find({'_id': {'$in': list(buckets)}}, {'taken': 1}):
+            bucket = buckets[doc['_id']]
+            if bucket.seen_total is not None:
+                others = doc['taken'] - bucket.seen_total - taken[doc['_id']]
+                bucket.tokens = max(bucket.tokens - others, 0)
+            bucket.seen_total = doc['taken']
+
+    def stats(self) -> dict:
+        return {
+            'enabled': RATE_LIMIT_ENABLED,
+            'ip_enabled': RATE_LIMIT_IP_ENABLED,
+            'buckets': sum(len(shard) for shard in self._shards)
+        }
+
+rate_limiter = RateLimiter(RATE_LIMIT_POLICIES, RATE_LIMIT_MAX_KEYS, RATE_LIMIT_SHARDS)
+
+# ==================== PASSWORD POOL ====================
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+PASSWORD_POOL_SIZE = int(os.environ.get('PASSWORD_POOL_SIZE', str(min(4, os.cpu_count() or 1))))
+PASSWORD_QUEUE_LIMIT = int(os.environ.get('PASSWORD_QUEUE_LIMIT', '100'))
+
+class PasswordPool:
+    """Runs bcrypt hashing and verification on a bounded thread pool.
+
+    bcrypt releases the GIL, so the threads hash in parallel while the event
+    loop keeps serving other requests. At most `size` calls run at once;
+    callers beyond that wait on a semaphore, and once `queue_limit` are
+    waiting new calls are rejected with a 503 instead of piling up.
+    """
+
+    def __init__(self, size: int, queue_limit: int):
+        self.size = size
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='bcrypt')
+        self._semaphore = None
+        self.running = 0
+        self.queued = 0
+        self.rejected = 0
+
+    async def run(self, func, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+        if self.queued >= self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server busy, please retry")
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {'size': self.size, 'running': self.running, 'queued': self.queued, 'rejected': self.rejected}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+password_pool = PasswordPool(PASSWORD_POOL_SIZE, PASSWORD_QUEUE_LIMIT)
+
 # ==================== HELPER FUNCTIONS ====================
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
-def create_token(user_id: str) -> str:
+def password_needs_rehash(hashed: str) -> bool:
+    """True when a stored hash was made with a different cost than BCRYPT_ROUNDS"""
+    try:
+        return int(hashed.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+def create_access_token(user: dict) -> str:
+    """Short-lived token carrying the user's plan state as signed claims"""
+    now = datetime.utcnow()
+    plan_expiry = user.get('plan_expiry')
+    payload = {
+        'user_id': str(user['_id']),
+        'type': 'access',
+        'jti': uuid.uuid4().hex,
+        'plan_type': user.get('plan_type', 'free'),
+        'plan_expiry': plan_expiry.isoformat() if plan_expiry else None,
+        'reminder_count': user.get('reminder_count', 0),
+        'pv': user.get('plan_version', 0),
+        'iat': now,
+        'exp': now + timedelta(minutes=ACCESS_TOKEN_TTL_MINUTES)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+def create_refresh_token(user_id: str) -> str:
+    now = datetime.utcnow()
     payload = {
         'user_id': user_id,
-        'exp': datetime.utcnow() + timedelta(days=30)
+        'type': 'refresh',
+        'jti': uuid.uuid4().hex,
+        'iat': now,
+        'exp': now + timedelta(days=REFRESH_TOKEN_TTL_DAYS)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def issue_tokens(user: dict) -> dict:
+    return {
+        'token': create_access_token(user),
+        'refresh_token': create_refresh_token(str(user['_id'])),
+        'expires_in': ACCESS_TOKEN_TTL_MINUTES * 60
+    }
+
+def decode_token(token: str, token_type: str) -> dict:
+    """Verify a token of the given type against its signature and the revocation list"""
+    payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    if payload.get('type') != token_type:
+        raise jwt.InvalidTokenError(f"Not a {token_type} token")
+    if revocation_list.is_revoked(payload['jti']):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    if token_type == 'access' and revocation_list.is_outdated(payload['user_id'], payload['pv']):
+        # The plan changed after this token was issued; the client has to refresh
+        raise HTTPException(status_code=401, detail="Token outdated")
+    return payload
+
+def claims_still_valid(claims: dict) -> bool:
+    """Whether verified claims have neither expired nor been revoked since; for long-lived connections"""
+    return claims['exp'] > time.time() and not revocation_list.is_revoked(claims['jti'])
+
+REFERRAL_CODE_ALPHABET = string.ascii_uppercase + string.digits
+REFERRAL_CODE_ATTEMPTS = 5
+
 def generate_referral_code() -> str:
-    """Generate a unique 8-character referral code"""
-    import random
-    import string
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-
-async def check_and_reward_referrer(referrer_id: str):
-    """Check if referrer has 5 referrals and reward them with premium"""
-    referral_count = await db.users.count_documents({'referred_by': referrer_id})
-    
-    if referral_count >= 5:
-        # Check if already rewarded
-        referrer = await db.users.find_one({'_id': ObjectId(referrer_id)})
-        if referrer and referrer.get('referral_reward_given') != True:
-            # Give 15 days of premium
-            expiry_date = datetime.utcnow() + timedelta(days=15)
-            await db.users.update_one(
-                {'_id': ObjectId(referrer_id)},
-                {'$set': {
-                    'plan_type': 'premium',
-                    'plan_expiry': expiry_date,
-                    'referral_reward_given': True
-                }}
+    """Generate a random 8-character referral code"""
+    return ''.join(random.choices(REFERRAL_CODE_ALPHABET, k=8))
+
+# Allocation counters, reported by /api/health
+referral_code_stats = {'allocated': 0, 'collisions': 0}
+
+def is_referral_code_collision(error: DuplicateKeyError) -> bool:
+    key_pattern = (error.details or {}).get('keyPattern')
+    if key_pattern:
+        return 'referral_code' in key_pattern
+    return 'referral_code' in str(error)
+
+async def insert_user_with_referral_code(user_doc: dict) -> str:
+    """Insert a new user with a fresh referral code and return the code.
+
+    The unique referral_code index does the collision check: the insert is
+    simply retried with a new code on a duplicate key, so no lookup is
+    needed beforehand. Duplicate emails are re-raised to the caller.
+    """
+    for _ in range(REFERRAL_CODE_ATTEMPTS):
+        user_doc['referral_code'] = generate_referral_code()
+        try:
+            await db.users.insert_one(user_doc)
+        except DuplicateKeyError as e:
+            if not is_referral_code_collision(e):
+                raise
+            referral_code_stats['collisions'] += 1
+            continue
+        referral_code_stats['allocated'] += 1
+        return user_doc['referral_code']
+    logger.error(f"No free referral code after {REFERRAL_CODE_ATTEMPTS} attempts")
+    raise HTTPException(status_code=503, detail="Could not complete registration, please retry")
+
+def to_utc_naive(value: datetime) -> datetime:
+    """Normalize a datetime to the naive UTC form Mongo hands back"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+@lru_cache(maxsize=1024)
+def get_zone(name: str) -> ZoneInfo:
+    """Zone for an IANA name; cached because every occurrence of a series needs one"""
+    return ZoneInfo(name)
+
+def local_to_utc(value: datetime, zone: ZoneInfo) -> datetime:
+    """Naive UTC time of a naive wall-clock time in `zone`, using the offset in force on that date"""
+    return value.replace(tzinfo=zone).astimezone(timezone.utc).replace(tzinfo=None)
+
+def utc_to_local(value: datetime, zone: ZoneInfo) -> datetime:
+    return value.replace(tzinfo=timezone.utc).astimezone(zone).replace(tzinfo=None)
+
+REMINDER_PAGE_DEFAULT = 100
+REMINDER_PAGE_MAX = int(os.environ.get('REMINDER_PAGE_MAX', '500'))
+
+# Only the fields reminder_response() reads are fetched from Mongo
+REMINDER_RESPONSE_FIELDS = {
+    'user_id': 1, 'name_to_call': 1, 'phone_number': 1, 'description': 1,
+    'date_time': 1, 'timezone': 1, 'next_fire_at': 1, 'recurrence': 1, 'snoozed_until': 1,
+    'status': 1, 'created_at': 1
+}
+
+def reminder_response(reminder: dict) -> dict:
+    """Reminder as returned by the API; datetimes are left for FastJSONResponse to render"""
+    return {
+        'id': str(reminder['_id']),
+        'user_id': reminder['user_id'],
+        'name_to_call': reminder['name_to_call'],
+        'phone_number': reminder['phone_number'],
+        'description': reminder.get('description', ''),
+        'date_time': reminder['date_time'],
+        'timezone': reminder.get('timezone'),
+        'next_fire_at': reminder.get('next_fire_at', reminder['date_time']),
+        'recurrence': reminder.get('recurrence'),
+        'snoozed_until': reminder.get('snoozed_until'),
+        'status': reminder['status'],
+        'created_at': reminder['created_at']
+    }
+
+def encode_reminder_cursor(reminder: dict) -> str:
+    """Opaque keyset cursor for the position just after this reminder"""
+    # Reminders from before recurrence support may not have been backfilled yet
+    position = reminder.get('next_fire_at') or reminder['date_time']
+    raw = f"{to_utc_naive(position).isoformat()}|{reminder['_id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_reminder_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        date_time, reminder_id = raw.split('|')
+        return datetime.fromisoformat(date_time), ObjectId(reminder_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+CHANGES_PAGE_MAX = int(os.environ.get('CHANGES_PAGE_MAX', '500'))
+# Change versions are reserved before the write that uses them lands, so they
+# can land out of order. A client is not moved past a change younger than this,
+# by which time every earlier version is expected to have landed.
+CHANGES_SETTLE_SECONDS = float(os.environ.get('CHANGES_SETTLE_SECONDS', '5'))
+
+def changes_settled_before() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+
+async def settled_change_version(user_id: str) -> int:
+    """The highest change version up to which every change of the user has landed"""
+    unsettled = await db.reminders.find_one(
+        {'user_id': user_id, 'version': {'$gt': 0}, 'updated_at': {'$gt': changes_settled_before()}},
+        {'version': 1},
+        sort=[('version', 1)]
+    )
+    query = {'user_id': user_id, 'version': {'$gt': 0}}
+    if unsettled:
+        query['version']['$lt'] = unsettled['version']
+    last = await db.reminders.find_one(query, {'version': 1}, sort=[('version', -1)])
+    return last['version'] if last else 0
+
+async def next_change_version(user_id: str, inc: Optional[dict] = None, count: int = 1) -> int:
+    """Reserve `count` change versions (plus bump any other counters) and return the last one"""
+    user = await db.users.find_one_and_update(
+        {'_id': ObjectId(user_id)},
+        {'$inc': {'change_version': count, **(inc or {})}},
+        projection={'change_version': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    user_cache.invalidate(user_id)
+    return user['change_version']
+
+FREE_REMINDER_LIMIT = 5
+REFERRAL_REWARD_THRESHOLD = 5
+# Referred user ids kept on a referrer to recognise a repeated referral event
+COUNTED_REFERRALS_KEPT = 50
+
+# Due lookups also consider series whose next_fire_at fell behind by up to this
+# much, so a late recurrence sweep never makes an occurrence go missing
+RECURRENCE_LOOKBACK = timedelta(hours=1)
+# Occurrences listed per series by /reminders/list?until=
+RECURRENCE_LIST_MAX = 100
+
+def iter_occurrences(start: datetime, rule: dict, after: datetime):
+    """Yield the occurrences of a series at or after `after`, in order.
+
+    The position of `after` in the series is computed directly rather than by
+    walking from `start`, so the cost does not grow with the age of the series.
+    Monthly series on days 29-31 skip months without that day, as RRULE does.
+    """
+    interval = rule.get('interval') or 1
+    until, count = rule.get('until'), rule.get('count')
+    after = max(after, start)
+    
+    def occurrences():
+        if rule['freq'] == 'daily':
+            step = timedelta(days=interval)
+            index = -((start - after) // step)  # ceil((after - start) / step)
+            while True:
+                yield index, start + index * step
+                index += 1
+        elif rule['freq'] == 'weekly':
+            days = sorted(set(rule.get('by_weekday') or [start.weekday()]))
+            week_zero = start - timedelta(days=start.weekday())
+            skipped = sum(1 for day in days if day < start.weekday())  # before start in its week
+            block = (after - week_zero) // timedelta(weeks=interval)
+            while True:
+                for position, day in enumerate(days):
+                    occurrence = week_zero + timedelta(weeks=block * interval, days=day)
+                    if occurrence >= start:
+                        yield block * len(days) + position - skipped, occurrence
+                block += 1
+        else:
+            # Months without start.day are skipped, so with a count and a late day
+            # of month the index can only be found by walking from the start
+            walk = count is not None and start.day > 28
+            months_after = (after.year - start.year) * 12 + after.month - start.month
+            block = 0 if walk else max(months_after // interval, 0)
+            index = block
+            while True:
+                month = start.month - 1 + block * interval
+                year, month = start.year + month // 12, month % 12 + 1
+                if start.day <= calendar.monthrange(year, month)[1]:
+                    yield index, start.replace(year=year, month=month)
+                    index += 1
+                elif not walk:
+                    index += 1
+                block += 1
+    
+    for index, occurrence in occurrences():
+        if (count is not None and index >= count) or (until is not None and occurrence > until):
+            return
+        if occurrence >= after:
+            yield occurrence
+
+def fire_times(reminder: dict, after: datetime):
+    """Yield the UTC fire times of a reminder at or after `after`, in order.
+
+    A series with a timezone repeats at the same wall-clock time there, so
+    each occurrence is expanded in local time and converted with the offset
+    in force on its own date, which keeps it right across DST changes. A
+    snoozed series also fires once at snoozed_until.
+    """
+    snoozed_until = reminder.get('snoozed_until')
+    if snoozed_until is not None and snoozed_until >= after:
+        yield from heapq.merge([snoozed_until], series_fire_times(reminder, after))
+    else:
+        yield from series_fire_times(reminder, after)
+
+def series_fire_times(reminder: dict, after: datetime):
+    """fire_times() of the reminder's own date_time and recurrence rule"""
+    start = to_utc_naive(reminder['date_time'])
+    rule = reminder.get('recurrence')
+    if not rule:
+        if start >= after:
+            yield start
+        return
+    if not reminder.get('timezone'):
+        yield from iter_occurrences(start, rule, after)
+        return
+    
+    zone = get_zone(reminder['timezone'])
+    until = rule.get('until')
+    # UTC offsets are under a day, so expanding from a day earlier in local time covers `after`
+    local_after = utc_to_local(after, zone) - timedelta(days=1)
+    for occurrence in iter_occurrences(utc_to_local(start, zone), dict(rule, until=None), local_after):
+        fire_at = local_to_utc(occurrence, zone)
+        if until is not None and fire_at > until:
+            return
+        if fire_at >= after:
+            yield fire_at
+
+def occurrences_between(reminder: dict, window_start: datetime, window_end: datetime) -> list:
+    """UTC fire times of a reminder inside [window_start, window_end]"""
+    found = []
+    for occurrence in fire_times(reminder, window_start):
+        if occurrence > window_end or len(found) == RECURRENCE_LIST_MAX:
+            break
+        found.append(occurrence)
+    return found
+
+def next_fire_time(reminder: dict, after: datetime):
+    """(next UTC fire time at or after `after`, whether the series goes on) for a reminder.
+
+    A series that has run out keeps its last occurrence, like a past one-off reminder.
+    """
+    start = to_utc_naive(reminder['date_time'])
+    if not reminder.get('recurrence'):
+        return start, False
+    upcoming = next(fire_times(reminder, after), None)
+    if upcoming is not None:
+        return upcoming, True
+    last = reminder.get('next_fire_at', start)
+    for occurrence in fire_times(reminder, last):
+        last = occurrence
+    return last, False
+
+def reminder_time_to_utc(value: datetime, timezone_name: Optional[str]) -> datetime:
+    """Naive UTC form of a client time; without an offset it is wall-clock time in the reminder's timezone"""
+    if timezone_name and value.tzinfo is None:
+        return local_to_utc(value, get_zone(timezone_name))
+    return to_utc_naive(value)
+
+def new_reminder_doc(user_id: str, reminder_data: ReminderCreate, now: datetime, version: int) -> dict:
+    def to_utc(value: datetime) -> datetime:
+        return reminder_time_to_utc(value, reminder_data.timezone)
+    
+    reminder = {
+        'user_id': user_id,
+        'name_to_call': reminder_data.name_to_call,
+        'phone_number': reminder_data.phone_number,
+        'description': reminder_data.description or '',
+        'date_time': to_utc(reminder_data.date_time),
+        'timezone': reminder_data.timezone,
+        'recurrence': None,
+        'status': 'active',
+        'created_at': now,
+        'updated_at': now,
+        'version': version
+    }
+    if reminder_data.recurrence:
+        rule = reminder_data.recurrence.model_dump()
+        if rule['until'] is not None:
+            rule['until'] = to_utc(rule['until'])
+        reminder['recurrence'] = rule
+    # A series may start in the past, and a weekly one may first fire after date_time
+    reminder['next_fire_at'], reminder['recurring'] = next_fire_time(reminder, now)
+    return reminder
+
+async def reserve_reminder_quota(user_id: str, count: int, apply_pending: bool = True) -> int:
+    """Atomically claim `count` reminders against the user's plan.
+
+    A single conditional find_one_and_update increments reminder_count and
+    reserves `count` change versions only if an unexpired premium plan, or
+    enough free-plan headroom, allows it, so parallel creates from several
+    devices cannot overshoot the limit. An expired premium plan counts as
+    free here; the plan expiry sweeper does the actual downgrade. Returns
+    the last reserved version.
+    
+    Deletes give their quota back through the outbox, so releases still
+    pending there are applied before a request is refused.
+    """
+    now = datetime.utcnow()
+    user = await db.users.find_one_and_update(
+        {'_id': ObjectId(user_id), '$or': [
+            {'plan_type': 'premium', 'plan_expiry': {'$not': {'$lt': now}}},
+            {'reminder_count': {'$not': {'$gt': FREE_REMINDER_LIMIT - count}}}
+        ]},
+        {'$inc': {'reminder_count': count, 'change_version': count}},
+        projection={'change_version': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if user:
+        user_cache.invalidate(user_id)
+        return user['change_version']
+    
+    if apply_pending and await outbox.apply_pending('reminder_deleted', user_id):
+        return await reserve_reminder_quota(user_id, count, apply_pending=False)
+    
+    # Rejected: find out why (only on the failure path)
+    user = await db.users.find_one({'_id': ObjectId(user_id)}, {'plan_type': 1})
+    if user and user.get('plan_type') == 'premium':
+        raise HTTPException(status_code=403, detail="Premium plan expired. Please renew to create more reminders.")
+    raise HTTPException(status_code=403, detail="Free plan limit reached. Upgrade to premium for unlimited reminders.")
+
+async def release_reminder_quota(user_id: str, count: int):
+    """Give back quota claimed for reminders that were never inserted"""
+    await db.users.update_one({'_id': ObjectId(user_id)}, {'$inc': {'reminder_count': -count}})
+    user_cache.invalidate(user_id)
+
+async def apply_reminder_batch(user: dict, reminder_ids: List[str], status: str) -> dict:
+    """Set `status` on a batch of the user's reminders and report the outcome per id.
+
+    Deletes take the same path as delete_reminder: the reminders become
+    tombstones whose quota is given back by the outbox, one event each.
+    """
+    user_id = str(user['_id'])
+    
+    object_ids = [ObjectId(rid) for rid in set(reminder_ids) if ObjectId.is_valid(rid)]
+    found = await db.reminders.find(
+        {'_id': {'$in': object_ids}, 'user_id': user_id, 'status': {'$ne': 'deleted'}},
+        {'_id': 1}
+    ).to_list(None)
+    targets = [str(r['_id']) for r in found]
+    
+    if targets:
+        now = datetime.utcnow()
+        # The status filter keeps a reminder deleted meanwhile from being deleted twice
+        live = {'user_id': user_id, 'status': {'$ne': 'deleted'}}
+        if status == 'deleted':
+            await outbox.put_many_with(
+                db.reminders.bulk_write([
+                    UpdateOne(
+                        {'_id': ObjectId(rid), **live},
+                        {'$set': {'status': status, 'updated_at': now, 'quota_released': False, 'recurring': False}}
+                    )
+                    for rid in targets
+                ], ordered=False),
+                'reminder_deleted',
+                [{'user_id': user_id, 'reminder_id': rid} for rid in targets]
             )
-            return True
+        else:
+            last_version = await next_change_version(user_id, None, len(targets))
+            first_version = last_version - len(targets) + 1
+            await db.reminders.bulk_write([
+                UpdateOne(
+                    {'_id': ObjectId(rid), **live},
+                    {'$set': {'status': status, 'updated_at': now, 'version': first_version + i, 'recurring': False}}
+                )
+                for i, rid in enumerate(targets)
+            ], ordered=False)
+        for rid in targets:
+            scheduler.remove(rid)
+    
+    applied = set(targets)
+    return {'results': [
+        {'id': rid, 'status': status if rid in applied else 'not_found'}
+        for rid in reminder_ids
+    ]}
+
+async def check_and_reward_referrer(referrer_id: str, user_id: str):
+    """Count the referral of `user_id` and reward the referrer with premium at 5 referrals.
+
+    counted_referrals is set in the same update as the count, so a repeated
+    call does not count twice but still gives a reward an earlier call missed.
+    """
+    projection = {'referral_count': 1, 'referral_reward_given': 1}
+    referrer = await db.users.find_one_and_update(
+        {'_id': ObjectId(referrer_id), 'counted_referrals': {'$ne': user_id}},
+        {
+            '$inc': {'referral_count': 1},
+            '$push': {'counted_referrals': {'$each': [user_id], '$slice': -COUNTED_REFERRALS_KEPT}}
+        },
+        projection=projection,
+        return_document=ReturnDocument.AFTER
+    )
+    if referrer:
+        user_cache.invalidate(referrer_id)
+    else:
+        referrer = await db.users.find_one({'_id': ObjectId(referrer_id)}, projection)
+    
+    if referrer and referrer['referral_count'] >= REFERRAL_REWARD_THRESHOLD and referrer.get('referral_reward_given') != True:
+        # Give 15 days of premium; the filter makes sure it is only given once
+        expiry_date = datetime.utcnow() + timedelta(days=15)
+        rewarded = await db.users.find_one_and_update(
+            {'_id': ObjectId(referrer_id), 'referral_reward_given': {'$ne': True}},
+            {'$set': {
+                'plan_type': 'premium',
+                'plan_expiry': expiry_date,
+                'referral_reward_given': True
+            }, '$inc': {'plan_version': 1}},
+            projection={'plan_version': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        user_cache.invalidate(referrer_id)
+        if rewarded:
+            await revocation_list.outdate_plan_claims({referrer_id: rewarded['plan_version']})
+        return rewarded is not None
     return False
 
-async def get_current_user(authorization: str = Header(None)):
+async def backfill_referral_counts() -> int:
+    """Set referral_count on every user from the referred_by links; returns users updated"""
+    counts = await db.users.aggregate([
+        {'$match': {'referred_by': {'$ne': None}}},
+        {'$group': {'_id': '$referred_by', 'count': {'$sum': 1}}}
+    ]).to_list(None)
+    
+    updates = [
+        UpdateOne({'_id': ObjectId(c['_id'])}, {'$set': {'referral_count': c['count']}})
+        for c in counts if ObjectId.is_valid(c['_id'])
+    ]
+    updated = 0
+    for start in range(0, len(updates), 1000):
+        result = await db.users.bulk_write(updates[start:start + 1000], ordered=False)
+        updated += result.modified_count
+    result = await db.users.update_many({'referral_count': {'$exists': False}}, {'$set': {'referral_count': 0}})
+    return updated + result.modified_count
+
+async def get_token_claims(authorization: str = Header(None)) -> dict:
+    """Verified access token claims, without loading the user"""
     if not authorization:
         raise HTTPException(status_code=401, detail="Authorization header missing")
     
     try:
-        token = authorization.replace('Bearer ', '')
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get('user_id')
-        
-        user = await db.users.find_one({'_id': ObjectId(user_id)})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        
-        return user
+        return decode_token(authorization.replace('Bearer ', ''), 'access')
+    except HTTPException:
+        raise
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+async def get_current_user(authorization: str = Header(None)):
+    claims = await get_token_claims(authorization)
+    user_id = claims['user_id']
+    
+    user = user_cache.get(user_id)
+    if user is None:
+        epoch = user_cache.epoch(user_id)
+        user = await db.users.find_one({'_id': ObjectId(user_id)}, {'password_hash': 0})
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        user_cache.set(user_id, user, epoch)
+    
+    return user
+
+# ==================== DATABASE INDEXES ====================
+
+# Indexes every query in this file relies on: collection -> [(keys, options)]
+REQUIRED_INDEXES = {
+    'users': [
+        ([('email', 1)], {'name': 'email_unique', 'unique': True}),
+        # Google sign-ups have no referral code, hence sparse
+        ([('referral_code', 1)], {'name': 'referral_code_unique', 'unique': True, 'sparse': True}),
+        ([('referred_by', 1)], {'name': 'referred_by'}),
+        ([('plan_type', 1), ('plan_expiry', 1)], {'name': 'plan_type_expiry'}),
+    ],
+    'reminders': [
+        ([('user_id', 1), ('status', 1), ('next_fire_at', 1)], {'name': 'user_status_next_fire_at'}),
+        ([('status', 1), ('next_fire_at', 1)], {'name': 'status_next_fire_at'}),
+        ([('recurring', 1), ('next_fire_at', 1)], {'name': 'recurring_next_fire_at'}),
+        ([('user_id', 1), ('version', 1)], {'name': 'user_version'}),
+        ([('updated_at', 1)], {'name': 'updated_at'}),
+    ],
+    'revoked_tokens': [
+        # Entries are useless once the token they cover has expired
+        ([('expires_at', 1)], {'name': 'expires_at_ttl', 'expireAfterSeconds': 0}),
+        ([('revoked_at', 1)], {'name': 'revoked_at'}),
+    ],
+    'rate_limits': [
+        ([('expires_at', 1)], {'name': 'expires_at_ttl', 'expireAfterSeconds': 0}),
+    ],
+    'device_tokens': [
+        ([('user_id', 1)], {'name': 'user_id'}),
+    ],
+    'outbox': [
+        ([('status', 1), ('available_at', 1)], {'name': 'status_available_at'}),
+        # Only failed events carry expires_at
+        ([('expires_at', 1)], {'name': 'expires_at_ttl', 'expireAfterSeconds': 0}),
+    ],
+    'push_receipts': [
+        ([('expires_at', 1)], {'name': 'expires_at_ttl', 'expireAfterSeconds': 0}),
+    ],
+}
+
+# Representative filter of each endpoint query: (collection, description, filter, sort)
+QUERY_SHAPES = [
+    ('users', 'user by email', {'email': 'probe@example.com'}, None),
+    ('users', 'user by referral code', {'referral_code': 'PROBE000'}, None),
+    ('users', 'referrals of a user', {'referred_by': '000000000000000000000000'}, None),
+    ('users', 'expired premium plans', {
+        'plan_type': 'premium',
+        'plan_expiry': {'$lt': datetime(2000, 1, 1)}
+    }, None),
+    ('reminders', 'reminder list', {
+        'user_id': '000000000000000000000000',
+        'status': {'$in': ['active', 'triggered']}
+    }, [('next_fire_at', 1), ('_id', 1)]),
+    ('reminders', 'due reminders of a user', {
+        'user_id': '000000000000000000000000',
+        'status': 'active',
+        'next_fire_at': {'$gte': datetime(2000, 1, 1), '$lte': datetime(2000, 1, 1, 0, 1)}
+    }, None),
+    ('reminders', 'changes since a version', {
+        'user_id': '000000000000000000000000',
+        'version': {'$gt': 0}
+    }, [('version', 1)]),
+    ('reminders', 'scheduler window', {
+        'status': 'active',
+        'next_fire_at': {'$gte': datetime(2000, 1, 1), '$lte': datetime(2000, 1, 2)}
+    }, None),
+    ('reminders', 'recently updated reminders', {
+        'updated_at': {'$gt': datetime(2000, 1, 1)}
+    }, None),
+    ('reminders', 'recurring reminders to advance', {
+        'recurring': True,
+        'next_fire_at': {'$lt': datetime(2000, 1, 1)}
+    }, None),
+    ('outbox', 'due outbox events', {
+        'status': 'pending',
+        'available_at': {'$lte': datetime(2000, 1, 1)}
+    }, [('available_at', 1)]),
+    ('device_tokens', 'devices of users', {'user_id': {'$in': ['000000000000000000000000']}}, None),
+    ('revoked_tokens', 'revocations since the last sync', {
+        'expires_at': {'$gt': datetime(2000, 1, 1)},
+        'revoked_at': {'$gte': datetime(2000, 1, 1)}
+    }, None),
+]
+
+# Sign-ups rely on these instead of looking the email up first, so they are
+# refused until the indexes are confirmed to exist
+SIGNUP_UNIQUE_INDEXES = ('email_unique', 'referral_code_unique')
+unique_indexes_ready = False
+
+def find_index(existing: dict, keys: list):
+    """(name, info) of the index in index_information() output built on keys, or (None, None)"""
+    return next(
+        ((name, info) for name, info in existing.items() if list(info['key']) == keys),
+        (None, None)
+    )
+
+def index_matches(info: dict, options: dict) -> bool:
+    # .get(k) rather than a False default, which would equal expireAfterSeconds=0
+    return all(info.get(k) == v for k, v in options.items() if k != 'name')
+
+async def check_unique_indexes() -> bool:
+    """Confirm the unique indexes sign-ups depend on exist on users with the required options"""
+    global unique_indexes_ready
+    existing = await db.users.index_information()
+    missing = []
+    for keys, options in REQUIRED_INDEXES['users']:
+        if options['name'] not in SIGNUP_UNIQUE_INDEXES:
+            continue
+        _, current = find_index(existing, keys)
+        if current is None or not index_matches(current, options):
+            missing.append(options['name'])
+    if missing:
+        logger.error(f"Unique indexes {', '.join(missing)} missing or drifted on users; sign-ups are refused")
+    unique_indexes_ready = not missing
+    return unique_indexes_ready
+
+async def require_unique_indexes():
+    if not unique_indexes_ready and not await check_unique_indexes():
+        raise HTTPException(status_code=503, detail="Registration is temporarily unavailable")
+
+async def ensure_indexes():
+    """Create required indexes that are missing and rebuild ones whose options drifted.
+
+    Unique indexes are never dropped: rebuilding one leaves a window in which
+    duplicates can be written and the rebuild then fails on them. Their drift
+    is logged and left for an operator, and check_unique_indexes() keeps
+    sign-ups refused meanwhile.
+    """
+    for collection_name, indexes in REQUIRED_INDEXES.items():
+        collection = db[collection_name]
+        try:
+            existing = await collection.index_information()
+        except Exception as e:
+            logger.error(f"Failed to list indexes on {collection_name}: {e}")
+            continue
+        for keys, options in indexes:
+            current_name, current = find_index(existing, keys)
+            try:
+                if current is not None:
+                    if index_matches(current, options):
+                        continue
+                    if options.get('unique') or current.get('unique'):
+                        logger.error(
+                            f"Unique index {current_name} on {collection_name} does not match {options}; "
+                            f"not rebuilding it, fix it by hand"
+                        )
+                        continue
+                    logger.warning(f"Index {current_name} on {collection_name} does not match {options}; rebuilding")
+                    await collection.drop_index(current_name)
+                else:
+                    logger.warning(f"Index {options['name']} missing on {collection_name}; building")
+                await collection.create_index(keys, **options)
+            except Exception as e:
+                logger.error(f"Failed to build index {options['name']} on {collection_name}: {e}")
+    await check_unique_indexes()
+
+def plan_stages(plan) -> list:
+    """All stage names in an explain() plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+async def check_query_plans() -> list:
+    """Explain every query shape and return the ones that fall back to a COLLSCAN"""
+    failures = []
+    for collection_name, description, query, sort in QUERY_SHAPES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = plan_stages(explain.get('queryPlanner', {}).get('winningPlan', {}))
+        if 'COLLSCAN' in stages:
+            failures.append(f"{collection_name}: {description}")
+        logger.info(f"{collection_name}: {description} -> {' <- '.join(stages)}")
+    return failures
+
+# ==================== PLAN EXPIRY SWEEPER ====================
+
+PLAN_EXPIRY_SWEEP_SECONDS = int(os.environ.get('PLAN_EXPIRY_SWEEP_SECONDS', '60'))
+PLAN_EXPIRY_SWEEP_BATCH = 1000
+
+# Sweep counters, reported by /api/health
+plan_expiry_stats = {'runs': 0, 'downgraded': 0, 'last_run': None, 'last_downgraded': 0}
+
+async def sweep_expired_plans() -> int:
+    """Downgrade every premium user whose plan has expired; returns how many.
+
+    Each batch is selected by id and downgraded with one update_many that
+    repeats the expiry condition, so the sweep is idempotent and several
+    replicas can run it at the same time.
+    """
+    now = datetime.utcnow()
+    expired_filter = {'plan_type': 'premium', 'plan_expiry': {'$lt': now}}
+    downgraded = 0
+    while True:
+        expired = await db.users.find(expired_filter, {'_id': 1, 'plan_version': 1}).to_list(PLAN_EXPIRY_SWEEP_BATCH)
+        if not expired:
+            break
+        ids = [u['_id'] for u in expired]
+        result = await db.users.update_many(
+            {'_id': {'$in': ids}, **expired_filter},
+            {'$set': {'plan_type': 'free'}, '$inc': {'plan_version': 1}}
+        )
+        downgraded += result.modified_count
+        for user_id in ids:
+            user_cache.invalidate(str(user_id))
+        await revocation_list.outdate_plan_claims({
+            str(u['_id']): u.get('plan_version', 0) + 1 for u in expired
+        })
+        if len(expired) < PLAN_EXPIRY_SWEEP_BATCH:
+            break
+
+    plan_expiry_stats['runs'] += 1
+    plan_expiry_stats['downgraded'] += downgraded
+    plan_expiry_stats['last_run'] = now.isoformat()
+    plan_expiry_stats['last_downgraded'] = downgraded
+    if downgraded:
+        logger.info(f"Plan expiry sweep downgraded {downgraded} users")
+    return downgraded
+
+# ==================== RECURRENCE SWEEPER ====================
+
+RECURRENCE_SWEEP_SECONDS = int(os.environ.get('RECURRENCE_SWEEP_SECONDS', '60'))
+RECURRENCE_SWEEP_BATCH = 1000
+
+async def advance_recurring_reminders() -> int:
+    """Move next_fire_at of every series whose occurrence has passed; returns how many.
+
+    Each update is conditional on the next_fire_at it was computed from, so
+    replicas sweeping at the same time cannot move a series backwards.
+    Completing or deleting a reminder clears `recurring`; a series still
+    flagged while no longer active is cleared here instead of advanced.
+    """
+    now = datetime.utcnow()
+    advanced = 0
+    while True:
+        due = await db.reminders.find(
+            {'recurring': True, 'next_fire_at': {'$lt': now}},
+            {'date_time': 1, 'timezone': 1, 'recurrence': 1, 'snoozed_until': 1, 'next_fire_at': 1, 'status': 1}
+        ).to_list(RECURRENCE_SWEEP_BATCH)
+        if not due:
+            break
+        updates = []
+        for r in due:
+            if r.get('status') != 'active':
+                updates.append(UpdateOne(
+                    {'_id': r['_id'], 'status': r.get('status')},
+                    {'$set': {'recurring': False}}
+                ))
+                continue
+            next_fire_at, recurring = next_fire_time(r, now)
+            updates.append(UpdateOne(
+                {'_id': r['_id'], 'next_fire_at': r['next_fire_at']},
+                {'$set': {'next_fire_at': next_fire_at, 'recurring': recurring}}
+            ))
+        result = await db.reminders.bulk_write(updates, ordered=False)
+        advanced += result.modified_count
+        if len(due) < RECURRENCE_SWEEP_BATCH:
+            break
+    return advanced
+
+async def backfill_next_fire_at() -> int:
+    """Set next_fire_at on reminders created before recurrence support; returns how many"""
+    result = await db.reminders.update_many(
+        {'next_fire_at': {'$exists': False}},
+        [{'$set': {'next_fire_at': '$date_time', 'recurring': False}}]
+    )
+    return result.modified_count
+
+# Periodic maintenance jobs
+job_scheduler = AsyncIOScheduler(timezone=timezone.utc)
+job_scheduler.add_job(
+    sweep_expired_plans, 'interval', seconds=PLAN_EXPIRY_SWEEP_SECONDS,
+    id='plan_expiry_sweep', max_instances=1, coalesce=True
+)
+job_scheduler.add_job(
+    advance_recurring_reminders, 'interval', seconds=RECURRENCE_SWEEP_SECONDS,
+    id='recurrence_sweep', max_instances=1, coalesce=True
+)
+job_scheduler.add_job(
+    revocation_list.sync, 'interval', seconds=REVOCATION_SYNC_SECONDS,
+    id='revocation_sync', max_instances=1, coalesce=True
+)
+if RATE_LIMIT_SYNC_SECONDS:
+    job_scheduler.add_job(
+        rate_limiter.sync, 'interval', seconds=RATE_LIMIT_SYNC_SECONDS,
+        id='rate_limit_sync', max_instances=1, coalesce=True
+    )
+
+# ==================== OUTBOX ====================
+
+OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS', '2'))
+OUTBOX_POLL_SECONDS = float(os.environ.get('OUTBOX_POLL_SECONDS', '1'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_LEASE = timedelta(seconds=30)
+OUTBOX_RETRY_BASE_SECONDS = 1
+OUTBOX_RETRY_MAX_SECONDS = 300
+OUTBOX_FAILED_TTL = timedelta(days=7)
+# Reminder ids kept on a user to recognise a repeated quota release
+RELEASED_REMINDERS_KEPT = 50
+
+class Outbox:
+    """Side effects of a write, applied after the response by a pool of workers.
+
+    Endpoints record an event in the outbox collection next to their own
+    write and return. Workers claim due events with a conditional update that
+    also leases them, so an event whose worker died becomes due again once
+    the lease runs out. Delivery is therefore at least once and every handler
+    must be idempotent. A failing event is retried with exponential backoff
+    and parked as 'failed' after OUTBOX_MAX_ATTEMPTS. Events recorded by this
+    worker are picked up right away, others within OUTBOX_POLL_SECONDS.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._handlers = {}  # kind -> async handler(**payload)
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+        self.applied = 0
+        self.retried = 0
+        self.failed = 0
+
+    def handler(self, kind: str):
+        def register(func):
+            self._handlers[kind] = func
+            return func
+        return register
+
+    async def put_with(self, write, kind: str, **payload):
+        """Await the `write` coroutine and record its event side by side, in one round trip.
+
+        A write that raises or returns None wrote nothing, so its event is
+        discarded again. If the event could not be recorded it is applied
+        inline instead, so it is never lost. Returns what `write` returned.
+        """
+        return await self.put_many_with(write, kind, [payload])
+
+    async def put_many_with(self, write, kind: str, payloads: List[dict]):
+        """put_with for a write, such as a bulk_write, that records one event per payload"""
+        now = datetime.utcnow()
+        events = [{
+            '_id': ObjectId(),
+            'kind': kind,
+            'payload': payload,
+            'status': 'pending',
+            'attempts': 0,
+            'available_at': now,
+            'created_at': now
+        } for payload in payloads]
+        result, recorded = await asyncio.gather(write, db.outbox.insert_many(events), return_exceptions=True)
+        if isinstance(result, BaseException) or result is None:
+            if not isinstance(recorded, BaseException):
+                await db.outbox.delete_many({'_id': {'$in': [event['_id'] for event in events]}})
+            if isinstance(result, BaseException):
+                raise result
+            return None
+        if isinstance(recorded, BaseException):
+            logger.error(f"Recording {len(events)} {kind} event(s) failed, applying them inline: {recorded}")
+            for payload in payloads:
+                await self._handlers[kind](**payload)
+        else:
+            self._wakeup.set()
+        return result
+
+    async def apply_pending(self, kind: str, user_id: str) -> int:
+        """Apply a user's pending events of `kind` now; returns how many were applied.
+
+        Events whose write has not landed yet are left to the workers.
+        """
+        events = await db.outbox.find(
+            {'status': 'pending', 'kind': kind, 'payload.user_id': user_id}
+        ).to_list(None)
+        applied = 0
+        for event in events:
+            try:
+                await self._handlers[kind](**event['payload'])
+            except LookupError:
+                continue
+            await db.outbox.delete_one({'_id': event['_id']})
+            applied += 1
+        return applied
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                event = await self._claim()
+            except Exception as e:
+                logger.error(f"Claiming an outbox event failed: {e}")
+                event = None
+            if event is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._apply(event)
+            except Exception as e:
+                logger.error(f"Settling outbox event {event['_id']} failed: {e}")
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await db.outbox.find_one_and_update(
+            {'status': 'pending', 'available_at': {'$lte': now}},
+            {'$set': {'available_at': now + OUTBOX_LEASE}, '$inc': {'attempts': 1}},
+            sort=[('available_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _apply(self, event: dict):
+        kind = event['kind']
+        try:
+            await self._handlers[kind](**event['payload'])
+        except Exception as e:
+            now = datetime.utcnow()
+            if event['attempts'] >= OUTBOX_MAX_ATTEMPTS:
+                self.failed += 1
+                OUTBOX_EVENTS.labels(kind, 'failed').inc()
+                logger.error(f"Outbox event {event['_id']} ({kind}) failed for good: {e}")
+                update = {'status': 'failed', 'error': str(e), 'expires_at': now + OUTBOX_FAILED_TTL}
+            else:
+                self.retried += 1
+                OUTBOX_EVENTS.labels(kind, 'retried').inc()
+                delay = min(OUTBOX_RETRY_BASE_SECONDS * 2 ** (event['attempts'] - 1), OUTBOX_RETRY_MAX_SECONDS)
+                update = {'available_at': now + timedelta(seconds=delay), 'error': str(e)}
+            await db.outbox.update_one({'_id': event['_id']}, {'$set': update})
+            return
+        await db.outbox.delete_one({'_id': event['_id']})
+        self.applied += 1
+        OUTBOX_EVENTS.labels(kind, 'applied').inc()
+        OUTBOX_LAG.observe((datetime.utcnow() - event['created_at']).total_seconds())
+
+    def stats(self) -> dict:
+        return {
+            'workers': len(self._tasks),
+            'applied': self.applied,
+            'retried': self.retried,
+            'failed': self.failed
+        }
+
+outbox = Outbox(OUTBOX_WORKERS)
+
+@outbox.handler('referral')
+async def apply_referral(user_id: str, referral_code: str):
+    """Link a new user to the owner of the referral code they signed up with"""
+    referrer = await db.users.find_one({'referral_code': referral_code}, {'_id': 1})
+    if not referrer or str(referrer['_id']) == user_id:
+        return
+    referrer_id = str(referrer['_id'])
+    result = await db.users.update_one(
+        {'_id': ObjectId(user_id), 'referred_by': None},
+        {'$set': {'referred_by': referrer_id}}
+    )
+    if result.modified_count:
+        user_cache.invalidate(user_id)
+    else:
+        user = await db.users.find_one({'_id': ObjectId(user_id)}, {'referred_by': 1})
+        if not user:
+            # The sign-up's own insert may not have landed yet; retried later
+            raise LookupError(f"User {user_id} not found")
+        if user['referred_by'] != referrer_id:
+            return
+    # Also reached when an earlier delivery linked the user but failed before counting
+    await check_and_reward_referrer(referrer_id, user_id)
+
+@outbox.handler('reminder_deleted')
+async def release_deleted_reminder(user_id: str, reminder_id: str):
+    """Give back the quota of a deleted reminder and stamp its tombstone with a change version"""
+    # The event is recorded before the delete is known to have matched, so it
+    # may name a reminder of another user
+    reminder = await db.reminders.find_one(
+        {'_id': ObjectId(reminder_id), 'user_id': user_id},
+        {'status': 1, 'quota_released': 1}
+    )
+    if not reminder:
+        return
+    if reminder['status'] != 'deleted':
+        # The event can be claimed before the delete it records lands; retried later
+        raise LookupError(f"Reminder {reminder_id} not deleted yet")
+    if reminder.get('quota_released') is not False:
+        return
+    # released_reminders makes a retry after a crash at the next step not decrement twice
+    user = await db.users.find_one_and_update(
+        {'_id': ObjectId(user_id), 'released_reminders': {'$ne': reminder_id}},
+        {
+            '$inc': {'reminder_count': -1, 'change_version': 1},
+            '$push': {'released_reminders': {'$each': [reminder_id], '$slice': -RELEASED_REMINDERS_KEPT}}
+        },
+        projection={'change_version': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if user:
+        user_cache.invalidate(user_id)
+        version = user['change_version']
+    else:
+        version = await next_change_version(user_id)
+    await db.reminders.update_one(
+        {'_id': ObjectId(reminder_id), 'user_id': user_id, 'quota_released': False},
+        {'$set': {'quota_released': True, 'updated_at': datetime.utcnow(), 'version': version}}
+    )
+
+# ==================== REMINDER SCHEDULER ====================
+
+# How far ahead of its date_time a reminder is handed to clients (matches the
+# one-minute window /reminders/check has always used)
+SCHEDULER_LOOKAHEAD = timedelta(minutes=1)
+# Only reminders due within this horizon are kept in memory; the rest are
+# picked up by the periodic reconcile pass
+SCHEDULER_HORIZON = timedelta(hours=int(os.environ.get('SCHEDULER_HORIZON_HOURS', '24')))
+SCHEDULER_RECONCILE_INTERVAL = timedelta(seconds=int(os.environ.get('SCHEDULER_RECONCILE_SECONDS', '300')))
+# Reminder writes made by other workers are picked up from their updated_at this often
+SCHEDULER_SYNC_INTERVAL = timedelta(seconds=int(os.environ.get('SCHEDULER_SYNC_SECONDS', '5')))
+
+REMINDER_CHECK_FIELDS = {
+    'user_id': 1, 'name_to_call': 1, 'phone_number': 1, 'description': 1,
+    'date_time': 1, 'timezone': 1, 'next_fire_at': 1, 'recurrence': 1, 'snoozed_until': 1,
+    'updated_at': 1
+}
+
+def reminder_check_payload(reminder: dict, occurrence: Optional[datetime] = None) -> dict:
+    """Shape of a due reminder (or one occurrence of a series) as returned by /reminders/check"""
+    return {
+        'id': str(reminder['_id']),
+        'name_to_call': reminder['name_to_call'],
+        'phone_number': reminder['phone_number'],
+        'description': reminder.get('description', ''),
+        'date_time': (occurrence or to_utc_naive(reminder['date_time'])).isoformat()
+    }
+
+class ReminderScheduler:
+    """Time-ordered in-memory schedule of upcoming active reminders.
+
+    Reminders are kept in a heap keyed by their next occurrence. When a
+    reminder enters the lookahead window it is fired into a per-user due set,
+    which is what /reminders/check reads instead of querying Mongo; a recurring
+    reminder then goes back on the heap at its following occurrence. The
+    schedule is loaded at startup and kept current by the reminder endpoints.
+    Writes made by other workers are picked up by a sync pass over recently
+    updated reminders every few seconds, and the whole schedule is
+    periodically reconciled against Mongo.
+    """
+
+    def __init__(self, lookahead: timedelta, horizon: timedelta, reconcile_interval: timedelta,
+                 sync_interval: timedelta):
+        self.lookahead = lookahead
+        self.horizon = horizon
+        self.reconcile_interval = reconcile_interval
+        self.sync_interval = sync_interval
+        self._heap = []  # (date_time, reminder_id), stale items skipped lazily
+        self._entries = {}  # reminder_id -> entry
+        self._due = {}  # user_id -> {reminder_id: entry}
+        self._dirty = None  # reminder ids touched while a reconcile or sync is running
+        self._loaded_until = None
+        self._next_reconcile = None
+        self._last_reconcile = None
+        self._synced_until = None  # updated_at up to which other workers' writes are applied
+        self._next_sync = None
+        self.lag = 0.0  # seconds the last timed wake-up ran behind schedule
+        self._wakeup = None
+        self._task = None
+        self._listeners = []
+
+    @property
+    def ready(self) -> bool:
+        return self._loaded_until is not None
+
+    def stats(self) -> dict:
+        return {
+            'ready': self.ready,
+            'scheduled': len(self._entries),
+            'lag_seconds': round(self.lag, 4),
+            'last_reconcile': self._last_reconcile.isoformat() if self._last_reconcile else None,
+            'synced_until': self._synced_until.isoformat() if self._synced_until else None
+        }
+
+    @staticmethod
+    def _entry(reminder: dict, occurrence: datetime) -> dict:
+        return {
+            'user_id': reminder['user_id'],
+            'date_time': occurrence,
+            'payload': reminder_check_payload(reminder, occurrence),
+            'updated_at': reminder.get('updated_at'),
+            # Kept for series so the following occurrence can be scheduled
+            'reminder': reminder if reminder.get('recurrence') else None,
+            'fired': False
+        }
+
+    def add(self, reminder: dict):
+        """Schedule (or reschedule) a reminder document"""
+        reminder_id = str(reminder['_id'])
+        self.remove(reminder_id)
+        if reminder.get('status') != 'active':
+            return
+        now = datetime.utcnow()
+        date_time, _ = next_fire_time(reminder, now)
+        if date_time < now:
+            return
+        if self._loaded_until is not None and date_time > self._loaded_until:
+            return
+        self._entries[reminder_id] = self._entry(reminder, date_time)
+        heapq.heappush(self._heap, (date_time, reminder_id))
+        self._notify()
+
+    def add_listener(self, callback):
+        """Register callback(user_id, payload), called as each reminder fires"""
+        self._listeners.append(callback)
+
+    def remove(self, reminder_id: str):
+        """Drop a reminder from the schedule if it is there"""
+        if self._dirty is not None:
+            self._dirty.add(reminder_id)
+        entry = self._entries.pop(reminder_id, None)
+        if entry:
+            # A series may have an earlier occurrence in the due set
+            self._drop_due(entry['user_id'], reminder_id)
+
+    def _drop_due(self, user_id: str, reminder_id: str):
+        user_due = self._due.get(user_id)
+        if user_due is not None:
+            user_due.pop(reminder_id, None)
+            if not user_due:
+                self._due.pop(user_id, None)
+
+    def due_for(self, user_id: str, now: datetime, limit: int = 10) -> list:
+        """Reminders for a user that fall inside [now, now + lookahead]"""
+        user_due = self._due.get(user_id)
+        if not user_due:
+            return []
+        for reminder_id, entry in [(rid, e) for rid, e in user_due.items() if e['date_time'] < now]:
+            if self._entries.get(reminder_id) is entry:
+                self.remove(reminder_id)
+            else:
+                # Only this occurrence is over; the series is already scheduled again
+                self._drop_due(user_id, reminder_id)
+        window_end = now + self.lookahead
+        entries = sorted(
+            (e for e in user_due.values() if e['date_time'] <= window_end),
+            key=lambda e: e['date_time']
+        )
+        return [e['payload'] for e in entries[:limit]]
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _fire_due(self, now: datetime):
+        fire_before = now + self.lookahead
+        while self._heap and self._heap[0][0] <= fire_before:
+            date_time, reminder_id = heapq.heappop(self._heap)
+            entry = self._entries.get(reminder_id)
+            if not entry or entry['fired'] or entry['date_time'] != date_time:
+                continue
+            entry['fired'] = True
+            self._due.setdefault(entry['user_id'], {})[reminder_id] = entry
+            for callback in self._listeners:
+                callback(entry['user_id'], entry['payload'])
+            
+            reminder = entry['reminder']
+            if reminder is not None:
+                following = next(fire_times(reminder, date_time + timedelta(microseconds=1)), None)
+                if following is not None and (self._loaded_until is None or following <= self._loaded_until):
+                    self._entries[reminder_id] = self._entry(reminder, following)
+                    heapq.heappush(self._heap, (following, reminder_id))
+
+    async def reconcile(self):
+        """Reload the schedule for the next horizon from Mongo"""
+        now = datetime.utcnow()
+        until = now + self.horizon
+        self._dirty = set()
+        try:
+            reminders = await db.reminders.find(
+                {'status': 'active', 'next_fire_at': {'$gte': now - RECURRENCE_LOOKBACK, '$lte': until}},
+                REMINDER_CHECK_FIELDS
+            ).to_list(None)
+            entries = {}
+            for r in reminders:
+                reminder_id = str(r['_id'])
+                date_time, _ = next_fire_time(r, now)
+                if reminder_id not in self._dirty and now <= date_time <= until:
+                    entries[reminder_id] = self._entry(r, date_time)
+            # Local changes made while the query was running win over Mongo
+            for reminder_id in self._dirty:
+                if reminder_id in self._entries:
+                    entries[reminder_id] = dict(self._entries[reminder_id], fired=False)
+        finally:
+            self._dirty = None
+
+        self._entries = entries
+        self._due = {}
+        self._heap = [(e['date_time'], rid) for rid, e in entries.items()]
+        heapq.heapify(self._heap)
+        self._loaded_until = until
+        self._last_reconcile = now
+        self._next_reconcile = now + self.reconcile_interval
+        self._synced_until = now
+        logger.info(f"Reminder scheduler loaded {len(entries)} reminders due before {until.isoformat()}")
+
+    async def sync(self) -> int:
+        """Apply reminders written since the last pass, by this or another worker; returns how many changed"""
+        now = datetime.utcnow()
+        # updated_at is taken before the write lands, so passes overlap by the
+        # same margin /reminders/changes allows for
+        since = self._synced_until - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+        self._dirty = set()
+        try:
+            reminders = await db.reminders.find(
+                {'updated_at': {'$gt': since}},
+                {**REMINDER_CHECK_FIELDS, 'status': 1}
+            ).to_list(None)
+            changed = 0
+            for r in reminders:
+                reminder_id = str(r['_id'])
+                entry = self._entries.get(reminder_id)
+                if reminder_id in self._dirty or (entry and entry['updated_at'] == r.get('updated_at')):
+                    continue
+                if entry is None and r['status'] != 'active':
+                    continue
+                self.add(r)
+                changed += 1
+        finally:
+            self._dirty = None
+        self._synced_until = now
+        self._next_sync = now + self.sync_interval
+        return changed
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = datetime.utcnow()
+            if self._next_reconcile is None or now >= self._next_reconcile:
+                try:
+                    await self.reconcile()
+                except Exception as e:
+                    logger.error(f"Reminder scheduler reconcile failed: {e}")
+                    self._next_reconcile = now + timedelta(seconds=30)
+            elif self._next_sync is None or now >= self._next_sync:
+                try:
+                    await self.sync()
+                except Exception as e:
+                    logger.error(f"Reminder scheduler sync failed: {e}")
+                    self._next_sync = now + self.sync_interval
+            self._fire_due(now)
+
+            wake_at = self._next_reconcile
+            if self._next_sync is not None:
+                wake_at = min(wake_at, self._next_sync)
+            if self._heap:
+                wake_at = min(wake_at, self._heap[0][0] - self.lookahead)
+            timeout = max((wake_at - datetime.utcnow()).total_seconds(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.lag = max((datetime.utcnow() - wake_at).total_seconds(), 0)
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            # Before Python 3.12 wait_for swallows a cancel that lands just as
+            # the wake-up event is set, so cancel until the task has ended
+            while not self._task.done():
+                self._task.cancel()
+                await asyncio.wait({self._task}, timeout=0.1)
+            self._task = None
+
+scheduler = ReminderScheduler(SCHEDULER_LOOKAHEAD, SCHEDULER_HORIZON, SCHEDULER_RECONCILE_INTERVAL,
+                              SCHEDULER_SYNC_INTERVAL)
+
+# ==================== REMINDER STREAM ====================
+
+STREAM_HEARTBEAT_SECONDS = int(os.environ.get('STREAM_HEARTBEAT_SECONDS', '25'))
+STREAM_QUEUE_SIZE = int(os.environ.get('STREAM_QUEUE_SIZE', '100'))
+
+class StreamSubscriber:
+    """One open /reminders/stream connection"""
+    __slots__ = ('queue', 'overflowed')
+
+    def __init__(self, queue_size: int):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+class ReminderStreamHub:
+    """Fans fired reminders out to the open streams of their owner.
+
+    Each connection gets a bounded queue. A connection that stops reading and
+    lets its queue fill up is marked as overflowed and closed once drained;
+    the client reconnects and picks up the current due set.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers = {}  # user_id -> set of StreamSubscriber
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(subs) for subs in self._subscribers.values())
+
+    def subscribe(self, user_id: str) -> StreamSubscriber:
+        subscriber = StreamSubscriber(self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, user_id: str, subscriber: StreamSubscriber):
+        subs = self._subscribers.get(user_id)
+        if subs:
+            subs.discard(subscriber)
+            if not subs:
+                del self._subscribers[user_id]
+
+    def publish(self, user_id: str, payload: dict):
+        for subscriber in self._subscribers.get(user_id, ()):
+            try:
+                subscriber.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                subscriber.overflowed = True
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+stream_hub = ReminderStreamHub(STREAM_QUEUE_SIZE)
+scheduler.add_listener(stream_hub.publish)
+
+Gauge('reminder_stream_connections', 'Open /reminders/stream connections').set_function(
+    lambda: stream_hub.connection_count)
+Gauge('scheduled_reminders', 'Reminders held by the in-memory scheduler').set_function(
+    lambda: len(scheduler._entries))
+Gauge('password_pool_queued', 'bcrypt calls waiting for a worker').set_function(
+    lambda: password_pool.queued)
+Gauge('password_pool_running', 'bcrypt calls running').set_function(
+    lambda: password_pool.running)
+Gauge('user_cache_hits', 'User cache hits since start').set_function(lambda: user_cache.hits)
+Gauge('user_cache_misses', 'User cache misses since start').set_function(lambda: user_cache.misses)
+Gauge('rate_limit_buckets', 'Token buckets held by the rate limiter').set_function(
+    lambda: rate_limiter.stats()['buckets'])
+
+# ==================== PUSH DISPATCH ====================
+
+PUSH_ENABLED = os.environ.get('PUSH_ENABLED', 'true').lower() == 'true'
+PUSH_API_URL = os.environ.get('PUSH_API_URL', 'https://exp.host/--/api/v2/push/send')
+PUSH_ACCESS_TOKEN = os.environ.get('PUSH_ACCESS_TOKEN', '')
+PUSH_BATCH_SIZE = 100  # Expo accepts at most 100 messages per request
+PUSH_WORKERS = int(os.environ.get('PUSH_WORKERS', '4'))
+PUSH_QUEUE_SIZE = int(os.environ.get('PUSH_QUEUE_SIZE', '10000'))
+PUSH_MAX_CONNECTIONS = int(os.environ.get('PUSH_MAX_CONNECTIONS', '10'))
+PUSH_MAX_RETRIES = int(os.environ.get('PUSH_MAX_RETRIES', '5'))
+PUSH_RETRY_BASE_SECONDS = float(os.environ.get('PUSH_RETRY_BASE_SECONDS', '0.5'))
+PUSH_RETRY_MAX_SECONDS = 30
+PUSH_TIMEOUT_SECONDS = 10
+PUSH_RECEIPT_TTL = timedelta(days=1)  # longer than any scheduler could refire an occurrence
+
+def push_message(token: str, payload: dict) -> dict:
+    """Expo push message for a due reminder, carrying what the incoming-call screen reads"""
+    return {
+        'to': token,
+        'title': f"Call {payload['name_to_call']}",
+        'body': payload['description'] or 'Reminder to make a call',
+        'sound': 'default',
+        'priority': 'high',
+        'data': {
+            'reminderId': payload['id'],
+            'nameToCall': payload['name_to_call'],
+            'phoneNumber': payload['phone_number'],
+            'description': payload['description']
+        }
+    }
+
+class PushDispatcher:
+    """Sends fired reminders to the owner's devices through the Expo push API.
+
+    The scheduler listener only puts the reminder on a bounded queue; worker
+    tasks drain it in batches, so one API call carries up to PUSH_BATCH_SIZE
+    messages and the calls share a small pool of keep-alive connections.
+    Every worker runs the scheduler, so a batch is first claimed in
+    push_receipts and only the notifications no other worker claimed are
+    sent. Throttled or failed calls are retried with exponential backoff and
+    jitter, and tokens Expo reports as DeviceNotRegistered are deleted.
+    """
+
+    def __init__(self, url: str, workers: int, queue_size: int):
+        self.url = url
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self._client = None
+        self._tasks = []
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.pruned = 0
+
+    def enqueue(self, user_id: str, payload: dict):
+        """Scheduler listener; must not block the scheduler loop"""
+        if not self._tasks:
+            return
+        try:
+            self.queue.put_nowait((time.monotonic(), user_id, payload))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            PUSH_NOTIFICATIONS.labels('dropped').inc()
+
+    def start(self):
+        if self._tasks:
+            return
+        headers = {'Accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'}
+        if PUSH_ACCESS_TOKEN:
+            headers['Authorization'] = f"Bearer {PUSH_ACCESS_TOKEN}"
+        self._client = httpx.AsyncClient(
+            headers=headers,
+            timeout=PUSH_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=PUSH_MAX_CONNECTIONS,
+                                max_keepalive_connections=PUSH_MAX_CONNECTIONS)
+        )
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _worker(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < PUSH_BATCH_SIZE and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self.dispatch(batch)
+            except Exception as e:
+                logger.error(f"Push dispatch of {len(batch)} notifications failed: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def dispatch(self, batch: list):
+        """Send a batch of (enqueued_at, user_id, payload) to every device of each user"""
+        batch = await self._claim(batch)
+        if not batch:
+            return
+        devices = {}
+        async for doc in db.device_tokens.find(
+            {'user_id': {'$in': list({user_id for _, user_id, _ in batch})}}, {'user_id': 1}
+        ):
+            devices.setdefault(doc['user_id'], []).append(doc['_id'])
+
+        messages = [
+            (enqueued_at, push_message(token, payload))
+            for enqueued_at, user_id, payload in batch
+            for token in devices.get(user_id, ())
+        ]
+        for i in range(0, len(messages), PUSH_BATCH_SIZE):
+            await self._send(messages[i:i + PUSH_BATCH_SIZE])
+
+    async def _claim(self, batch: list) -> list:
+        """Keep the notifications no other worker has sent yet"""
+        expires_at = datetime.utcnow() + PUSH_RECEIPT_TTL
+        unique = {}
+        for item in batch:
+            unique.setdefault(f"{item[2]['id']}:{item[2]['date_time']}", item)
+        keys = list(unique)
+        try:
+            await db.push_receipts.insert_many(
+                [{'_id': key, 'expires_at': expires_at} for key in keys], ordered=False
+            )
+            return list(unique.values())
+        except BulkWriteError as e:
+            taken = {keys[err['index']] for err in e.details['writeErrors'] if err['code'] == 11000}
+            if len(taken) < len(e.details['writeErrors']):
+                raise
+            return [item for key, item in unique.items() if key not in taken]
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(int(retry_after), PUSH_RETRY_MAX_SECONDS)
+        delay = PUSH_RETRY_BASE_SECONDS * 2 ** attempt
+        return min(delay * random.uniform(0.5, 1.5), PUSH_RETRY_MAX_SECONDS)
+
+    async def _send(self, messages: list):
+        """POST one batch of (enqueued_at, message), retrying what Expo did not accept"""
+        pending = messages
+        response = None
+        for attempt in range(PUSH_MAX_RETRIES + 1):
+            if attempt:
+                PUSH_RETRIES.inc()
+                await asyncio.sleep(self._backoff(attempt - 1, response))
+            PUSH_BATCH_SIZE_HISTOGRAM.observe(len(pending))
+            start = time.perf_counter()
+            try:
+                response = await self._client.post(self.url, json=[message for _, message in pending])
+            except httpx.HTTPError as e:
+                response = None
+                logger.warning(f"Push API call failed: {e!r}")
+                continue
+            finally:
+                PUSH_SEND_LATENCY.observe(time.perf_counter() - start)
+
+            if response.status_code == 429 or response.status_code >= 500:
+                continue
+            if response.status_code >= 400:
+                logger.error(f"Push API rejected a batch: {response.status_code} {response.text[:200]}")
+                break
+
+            retry, dead = [], []
+            delivered_at = time.monotonic()
+            for (enqueued_at, message), ticket in zip(pending, response.json().get('data', [])):
+                if ticket.get('status') == 'ok':
+                    self.sent += 1
+                    PUSH_NOTIFICATIONS.labels('sent').inc()
+                    PUSH_DELIVERY_LATENCY.observe(delivered_at - enqueued_at)
+                    continue
+                error = (ticket.get('details') or {}).get('error')
+                if error == 'DeviceNotRegistered':
+                    dead.append(message['to'])
+                elif error == 'MessageRateExceeded':
+                    retry.append((enqueued_at, message))
+                else:
+                    self.failed += 1
+                    PUSH_NOTIFICATIONS.labels('failed').inc()
+                    logger.warning(f"Push to {message['to']} failed: {ticket.get('message')}")
+            if dead:
+                await self._prune(dead)
+            pending = retry
+            response = None
+            if not pending:
+                return
+
+        self.failed += len(pending)
+        PUSH_NOTIFICATIONS.labels('failed').inc(len(pending))
+
+    async def _prune(self, tokens: list):
+        """Forget tokens of uninstalled apps so they are not sent to again"""
+        result = await db.device_tokens.delete_many({'_id': {'$in': tokens}})
+        self.pruned += result.deleted_count
+        PUSH_NOTIFICATIONS.labels('device_not_registered').inc(len(tokens))
+
+    def stats(self) -> dict:
+        return {
+            'enabled': bool(self._tasks),
+            'queued': self.queue.qsize(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'pruned_tokens': self.pruned
+        }
+
+push_dispatcher = PushDispatcher(PUSH_API_URL, PUSH_WORKERS, PUSH_QUEUE_SIZE)
+scheduler.add_listener(push_dispatcher.enqueue)
+
+Gauge('push_queue_depth', 'Notifications waiting for a push worker').set_function(
+    lambda: push_dispatcher.queue.qsize())
+
 # ==================== AUTH ENDPOINTS ====================
 
 @api_router.post("/auth/register")
-async def register(user_data: UserCreate):
-    # Check if user exists
-    existing_user = await db.users.find_one({'email': user_data.email})
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
-    # Validate referral code if provided
-    referrer_id = None
-    if user_data.referral_code:
-        referrer = await db.users.find_one({'referral_code': user_data.referral_code})
-        if referrer:
-            referrer_id = str(referrer['_id'])
-    
-    # Generate unique referral code for new user
-    referral_code = generate_referral_code()
-    while await db.users.find_one({'referral_code': referral_code}):
-        referral_code = generate_referral_code()
+async def register(user_data: UserCreate, request: Request):
+    rate_limiter.check('register', request)
     
-    # Create user
+    # Create user; the unique email index rejects existing accounts
+    password_hash = await password_pool.run(hash_password, user_data.password)
     user_doc = {
         'name': user_data.name,
         'email': user_data.email,
-        'password_hash': hash_password(user_data.password),
+        'password_hash': password_hash,
         'plan_type': 'free',
         'plan_expiry': None,
         'reminder_count': 0,
-        'referral_code': referral_code,
-        'referred_by': referrer_id,
+        'referred_by': None,  # set from the referral code by the outbox
         'referral_reward_given': False,
+        'referral_count': 0,
+        'plan_version': 0,
         'created_at': datetime.utcnow()
     }
     
-    result = await db.users.insert_one(user_doc)
-    user_id = str(result.inserted_id)
+    user_doc['_id'] = ObjectId()
+    user_id = str(user_doc['_id'])
     
-    # Check if referrer should be rewarded
-    if referrer_id:
-        await check_and_reward_referrer(referrer_id)
-    
-    token = create_token(user_id)
+    await require_unique_indexes()
+    try:
+        if user_data.referral_code:
+            # The referrer is looked up and rewarded off the request path
+            referral_code = await outbox.put_with(
+                insert_user_with_referral_code(user_doc), 'referral',
+                user_id=user_id, referral_code=user_data.referral_code
+            )
+        else:
+            referral_code = await insert_user_with_referral_code(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     return {
-        'token': token,
+        **issue_tokens(user_doc),
         'user': {
             'id': user_id,
             'name': user_data.name,
@@ -206,19 +2431,30 @@ async def register(user_data: UserCreate):
     }
 
 @api_router.post("/auth/login")
-async def login(user_data: UserLogin):
+async def login(user_data: UserLogin, request: Request):
+    rate_limiter.check('login', request, email=user_data.email.lower())
+    
     user = await db.users.find_one({'email': user_data.email})
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if not verify_password(user_data.password, user['password_hash']):
+    # Google accounts have no password to check against
+    if not user.get('password_hash'):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    
+    if not await password_pool.run(verify_password, user_data.password, user['password_hash']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     user_id = str(user['_id'])
-    token = create_token(user_id)
+    
+    # Upgrade hashes made with an older cost factor while we have the password
+    if password_needs_rehash(user['password_hash']):
+        password_hash = await password_pool.run(hash_password, user_data.password)
+        await db.users.update_one({'_id': user['_id']}, {'$set': {'password_hash': password_hash}})
+        user_cache.invalidate(user_id)
     
     return {
-        'token': token,
+        **issue_tokens(user),
         'user': {
             'id': user_id,
             'name': user['name'],
@@ -237,6 +2473,7 @@ async def google_auth(auth_data: GoogleAuthRequest):
     if user:
         user_id = str(user['_id'])
     else:
+        await require_unique_indexes()
         # Create new user
         user_doc = {
             'name': auth_data.name,
@@ -246,16 +2483,15 @@ async def google_auth(auth_data: GoogleAuthRequest):
             'plan_expiry': None,
             'reminder_count': 0,
             'auth_provider': 'google',
+            'plan_version': 0,
             'created_at': datetime.utcnow()
         }
         result = await db.users.insert_one(user_doc)
         user_id = str(result.inserted_id)
         user = user_doc
     
-    token = create_token(user_id)
-    
     return {
-        'token': token,
+        **issue_tokens(user),
         'user': {
             'id': user_id,
             'name': user['name'],
@@ -266,136 +2502,383 @@ async def google_auth(auth_data: GoogleAuthRequest):
         }
     }
 
+
+@api_router.post("/auth/refresh")
+async def refresh_tokens(data: RefreshRequest):
+    """Exchange a refresh token for a new token pair carrying the current plan"""
+    try:
+        claims = decode_token(data.refresh_token, 'refresh')
+    except HTTPException:
+        raise
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Refresh token expired")
+    except Exception as e:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    
+    # Refresh tokens are single use; revoke before awaiting so a replay loses the race
+    await revocation_list.revoke(claims['jti'], claims['user_id'], datetime.utcfromtimestamp(claims['exp']))
+    
+    user = await db.users.find_one({'_id': ObjectId(claims['user_id'])}, {'password_hash': 0})
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return issue_tokens(user)
+
+@api_router.post("/auth/logout")
+async def logout(data: Optional[LogoutRequest] = None, claims: dict = Depends(get_token_claims)):
+    """Revoke the presented access token and, if given, the refresh token and device"""
+    await revocation_list.revoke(claims['jti'], claims['user_id'], datetime.utcfromtimestamp(claims['exp']))
+    
+    if data and data.refresh_token:
+        try:
+            refresh = decode_token(data.refresh_token, 'refresh')
+        except Exception:
+            refresh = None
+        if refresh and refresh['user_id'] == claims['user_id']:
+            await revocation_list.revoke(refresh['jti'], refresh['user_id'], datetime.utcfromtimestamp(refresh['exp']))
+    
+    if data and data.device_token:
+        await db.device_tokens.delete_one({'_id': data.device_token, 'user_id': claims['user_id']})
+    
+    return {'message': 'Logged out'}
+
 # ==================== REMINDER ENDPOINTS ====================
 
 @api_router.post("/reminders/create")
 async def create_reminder(reminder_data: ReminderCreate, current_user = Depends(get_current_user)):
     user_id = str(current_user['_id'])
     
-    # Check subscription limits
-    plan_type = current_user.get('plan_type', 'free')
-    reminder_count = current_user.get('reminder_count', 0)
-    
-    if plan_type == 'free' and reminder_count >= 5:
-        raise HTTPException(status_code=403, detail="Free plan limit reached. Upgrade to premium for unlimited reminders.")
-    
-    # Check if premium plan expired
-    if plan_type == 'premium':
-        plan_expiry = current_user.get('plan_expiry')
-        if plan_expiry and plan_expiry < datetime.utcnow():
-            # Downgrade to free
-            await db.users.update_one(
-                {'_id': ObjectId(user_id)},
-                {'$set': {'plan_type': 'free'}}
-            )
-            raise HTTPException(status_code=403, detail="Premium plan expired. Please renew to create more reminders.")
+    # Claim quota and the next change version in one round trip
+    version = await reserve_reminder_quota(user_id, 1)
     
     # Create reminder
-    reminder_doc = {
-        'user_id': user_id,
-        'name_to_call': reminder_data.name_to_call,
-        'phone_number': reminder_data.phone_number,
-        'description': reminder_data.description or '',
-        'date_time': reminder_data.date_time,
-        'status': 'active',
-        'created_at': datetime.utcnow()
-    }
+    reminder_doc = new_reminder_doc(user_id, reminder_data, datetime.utcnow(), version)
     
-    result = await db.reminders.insert_one(reminder_doc)
+    try:
+        await db.reminders.insert_one(reminder_doc)
+    except Exception:
+        await release_reminder_quota(user_id, 1)
+        raise
+    scheduler.add(reminder_doc)
     
-    # Increment reminder count
-    await db.users.update_one(
-        {'_id': ObjectId(user_id)},
-        {'$inc': {'reminder_count': 1}}
-    )
+    return reminder_response(reminder_doc)
+
+@api_router.post("/reminders/batch/create")
+async def batch_create_reminders(batch: ReminderBatchCreate, current_user = Depends(get_current_user)):
+    """Create up to REMINDER_BATCH_MAX reminders with one insert_many and one counter update"""
+    user_id = str(current_user['_id'])
     
-    return {
-        'id': str(result.inserted_id),
-        'user_id': user_id,
-        'name_to_call': reminder_doc['name_to_call'],
-        'phone_number': reminder_doc['phone_number'],
-        'description': reminder_doc['description'],
-        'date_time': reminder_doc['date_time'].isoformat(),
-        'status': reminder_doc['status'],
-        'created_at': reminder_doc['created_at'].isoformat()
-    }
+    # The whole batch has to fit in the plan, otherwise nothing is created.
+    # One version per reminder so /reminders/changes can page through them.
+    last_version = await reserve_reminder_quota(user_id, len(batch.reminders))
+    first_version = last_version - len(batch.reminders) + 1
+    
+    now = datetime.utcnow()
+    reminder_docs = [
+        new_reminder_doc(user_id, reminder_data, now, first_version + i)
+        for i, reminder_data in enumerate(batch.reminders)
+    ]
+    try:
+        await db.reminders.insert_many(reminder_docs)
+        inserted = len(reminder_docs)
+    except BulkWriteError as e:
+        # An ordered insert stops at the first failure; everything before it is stored
+        inserted = e.details['nInserted']
+        logger.error(f"Batch create for {user_id} stopped after {inserted} of {len(reminder_docs)}: {e}")
+        await release_reminder_quota(user_id, len(reminder_docs) - inserted)
+    except Exception:
+        await release_reminder_quota(user_id, len(reminder_docs))
+        raise
+    for reminder_doc in reminder_docs[:inserted]:
+        scheduler.add(reminder_doc)
+    
+    return {'results': [
+        {'index': i, 'status': 'created', 'reminder': reminder_response(r)} if i < inserted
+        else {'index': i, 'status': 'failed'}
+        for i, r in enumerate(reminder_docs)
+    ]}
+
+@api_router.post("/reminders/batch/complete")
+async def batch_complete_reminders(batch: ReminderBatchIds, current_user = Depends(get_current_user)):
+    """Mark up to REMINDER_BATCH_MAX reminders completed with one bulk_write"""
+    return await apply_reminder_batch(current_user, batch.ids, 'completed')
+
+@api_router.post("/reminders/batch/delete")
+async def batch_delete_reminders(batch: ReminderBatchIds, current_user = Depends(get_current_user)):
+    """Delete up to REMINDER_BATCH_MAX reminders with one bulk_write; their quota is given back by the outbox"""
+    return await apply_reminder_batch(current_user, batch.ids, 'deleted')
 
 @api_router.get("/reminders/list")
-async def get_reminders(current_user = Depends(get_current_user)):
+async def get_reminders(
+    cursor: Optional[str] = None,
+    limit: int = Query(REMINDER_PAGE_DEFAULT, ge=1, le=REMINDER_PAGE_MAX),
+    until: Optional[datetime] = None,
+    current_user = Depends(get_current_user)
+):
+    """One page of reminders ordered by (next_fire_at, _id); X-Next-Cursor points at the next page.
+
+    With `until`, every reminder also lists its occurrences from now until then.
+    """
     user_id = str(current_user['_id'])
     
-    reminders = await db.reminders.find({
+    query = {
         'user_id': user_id,
         'status': {'$in': ['active', 'triggered']}
-    }).sort('date_time', 1).to_list(100)
-    
-    return [{
-        'id': str(r['_id']),
-        'user_id': r['user_id'],
-        'name_to_call': r['name_to_call'],
-        'phone_number': r['phone_number'],
-        'description': r.get('description', ''),
-        'date_time': r['date_time'].isoformat(),
-        'status': r['status'],
-        'created_at': r['created_at'].isoformat()
-    } for r in reminders]
+    }
+    if cursor:
+        after_date_time, after_id = decode_reminder_cursor(cursor)
+        query['$or'] = [
+            {'next_fire_at': {'$gt': after_date_time}},
+            {'next_fire_at': after_date_time, '_id': {'$gt': after_id}}
+        ]
+    
+    # Read one extra document to know whether another page exists
+    reminders = await db.reminders.find(query, REMINDER_RESPONSE_FIELDS).sort(
+        [('next_fire_at', 1), ('_id', 1)]
+    ).to_list(limit + 1)
+    
+    items = [reminder_response(r) for r in reminders[:limit]]
+    if until is not None:
+        now, until = datetime.utcnow(), to_utc_naive(until)
+        for item, r in zip(items, reminders):
+            item['occurrences'] = occurrences_between(r, now, until)
+    response = FastJSONResponse(items)
+    if len(reminders) > limit:
+        response.headers['X-Next-Cursor'] = encode_reminder_cursor(reminders[limit - 1])
+    return response
 
 @api_router.delete("/reminders/{reminder_id}")
 async def delete_reminder(reminder_id: str, current_user = Depends(get_current_user)):
     user_id = str(current_user['_id'])
     
-    reminder = await db.reminders.find_one({'_id': ObjectId(reminder_id), 'user_id': user_id})
+    # The deleted document stays behind as the tombstone /reminders/changes
+    # reports; the outbox gives the quota back and stamps its change version
+    reminder = await outbox.put_with(
+        db.reminders.find_one_and_update(
+            {'_id': ObjectId(reminder_id), 'user_id': user_id, 'status': {'$ne': 'deleted'}},
+            {'$set': {'status': 'deleted', 'updated_at': datetime.utcnow(), 'quota_released': False, 'recurring': False}},
+            projection={'_id': 1}
+        ),
+        'reminder_deleted', user_id=user_id, reminder_id=reminder_id
+    )
     if not reminder:
         raise HTTPException(status_code=404, detail="Reminder not found")
-    
-    await db.reminders.update_one(
-        {'_id': ObjectId(reminder_id)},
-        {'$set': {'status': 'deleted'}}
-    )
-    
-    # Decrement reminder count
-    await db.users.update_one(
-        {'_id': ObjectId(user_id)},
-        {'$inc': {'reminder_count': -1}}
-    )
+    scheduler.remove(reminder_id)
     
     return {'message': 'Reminder deleted successfully'}
 
 @api_router.get("/reminders/check")
-async def check_reminders(current_user = Depends(get_current_user)):
+async def check_reminders(request: Request, current_user = Depends(get_current_user)):
     """Check for reminders that should trigger now"""
     user_id = str(current_user['_id'])
+    rate_limiter.check('reminders_check', request, user=user_id)
     current_time = datetime.utcnow()
     
+    # Served from the in-memory schedule once it has been loaded
+    if scheduler.ready:
+        return FastJSONResponse(scheduler.due_for(user_id, current_time))
+    
     # Find reminders within next minute
+    window_end = current_time + timedelta(minutes=1)
     reminders = await db.reminders.find({
         'user_id': user_id,
         'status': 'active',
-        'date_time': {
-            '$gte': current_time,
-            '$lte': current_time + timedelta(minutes=1)
+        'next_fire_at': {
+            '$gte': current_time - RECURRENCE_LOOKBACK,
+            '$lte': window_end
         }
-    }).to_list(10)
+    }, REMINDER_CHECK_FIELDS).to_list(None)
+    
+    due = sorted(
+        ((occurrence, r) for r in reminders for occurrence in occurrences_between(r, current_time, window_end)),
+        key=lambda item: item[0]
+    )
+    return FastJSONResponse([reminder_check_payload(r, occurrence) for occurrence, r in due[:10]])
+
+@api_router.get("/reminders/stream")
+async def stream_reminders(claims: dict = Depends(get_token_claims)):
+    """Server-Sent Events stream of due reminders, replacing /reminders/check polling.
+
+    The stream outlives its access token, so the token is checked again on
+    every wake-up and the stream ends once it expires or is revoked; the
+    client reconnects with a fresh one.
+    """
+    user_id = claims['user_id']
+    
+    async def events():
+        # Subscribe and snapshot without awaiting in between so nothing is missed
+        subscriber = stream_hub.subscribe(user_id)
+        initial = scheduler.due_for(user_id, datetime.utcnow()) if scheduler.ready else []
+        try:
+            yield sse_event('reminders', initial)
+            # An overflowed stream still sends what was queued before closing
+            while not (subscriber.overflowed and subscriber.queue.empty()):
+                try:
+                    payload = await asyncio.wait_for(subscriber.queue.get(), timeout=STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    payload = None
+                if not claims_still_valid(claims):
+                    break
+                if payload is None:
+                    yield ": heartbeat\n\n"
+                    continue
+                batch = [payload]
+                while not subscriber.queue.empty():
+                    batch.append(subscriber.queue.get_nowait())
+                yield sse_event('reminders', batch)
+        finally:
+            stream_hub.unsubscribe(user_id, subscriber)
     
-    return [{
-        'id': str(r['_id']),
-        'name_to_call': r['name_to_call'],
-        'phone_number': r['phone_number'],
-        'description': r.get('description', ''),
-        'date_time': r['date_time'].isoformat()
-    } for r in reminders]
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@api_router.get("/reminders/changes")
+async def get_reminder_changes(
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(CHANGES_PAGE_MAX, ge=1, le=CHANGES_PAGE_MAX),
+    current_user = Depends(get_current_user)
+):
+    """Reminders created, updated, completed or deleted after change version `since`.
+
+    Without `since` the answer is reset=True and the settled version: the
+    client loads /reminders/list once and then syncs from that version.
+    When has_more is set the client asks again with the returned version.
+    Changes younger than CHANGES_SETTLE_SECONDS are sent again next time.
+    """
+    user_id = str(current_user['_id'])
+    
+    if since is None:
+        version = await settled_change_version(user_id)
+        return {'reset': True, 'version': version, 'changes': [], 'deleted': [], 'has_more': False}
+    
+    settled_before = changes_settled_before()
+    reminders = await db.reminders.find(
+        {'user_id': user_id, 'version': {'$gt': since}},
+        {**REMINDER_RESPONSE_FIELDS, 'version': 1, 'updated_at': 1}
+    ).sort('version', 1).to_list(limit + 1)
+    
+    has_more = len(reminders) > limit
+    reminders = reminders[:limit]
+    
+    # Recent changes are sent, but the version stops before the first of them
+    # so the client asks for them again once earlier versions have landed
+    version = since
+    for reminder in reminders:
+        if reminder.get('updated_at') and reminder['updated_at'] > settled_before:
+            has_more = False
+            break
+        version = reminder['version']
+    
+    return FastJSONResponse({
+        'reset': False,
+        'version': version,
+        'changes': [reminder_response(r) for r in reminders if r['status'] != 'deleted'],
+        'deleted': [str(r['_id']) for r in reminders if r['status'] == 'deleted'],
+        'has_more': has_more
+    })
 
 @api_router.post("/reminders/{reminder_id}/complete")
 async def complete_reminder(reminder_id: str, current_user = Depends(get_current_user)):
     user_id = str(current_user['_id'])
     
-    await db.reminders.update_one(
+    version = await next_change_version(user_id)
+    result = await db.reminders.update_one(
         {'_id': ObjectId(reminder_id), 'user_id': user_id},
-        {'$set': {'status': 'completed'}}
+        {'$set': {'status': 'completed', 'updated_at': datetime.utcnow(), 'version': version, 'recurring': False}}
     )
+    if result.matched_count:
+        scheduler.remove(reminder_id)
     
     return {'message': 'Reminder completed'}
 
+SNOOZE_MAX_MINUTES = 24 * 60
+
+async def reschedule_reminder_doc(reminder_id: str, user_id: str, update) -> dict:
+    """Apply a new fire time with one find_one_and_update and move the reminder in the schedule.
+
+    The update also writes next_fire_at as its best guess; when the rule says
+    otherwise (a series that comes round before a snooze ends, or one whose
+    new start is in the past) it is corrected with a second write.
+    """
+    reminder = await db.reminders.find_one_and_update(
+        {'_id': ObjectId(reminder_id), 'user_id': user_id, 'status': {'$ne': 'deleted'}},
+        update,
+        return_document=ReturnDocument.AFTER
+    )
+    if not reminder:
+        raise HTTPException(status_code=404, detail="Reminder not found")
+    
+    next_fire_at, recurring = next_fire_time(reminder, datetime.utcnow())
+    if next_fire_at != reminder['next_fire_at'] or recurring != reminder.get('recurring'):
+        await db.reminders.update_one(
+            {'_id': reminder['_id'], 'version': reminder['version']},
+            {'$set': {'next_fire_at': next_fire_at, 'recurring': recurring}}
+        )
+        reminder.update(next_fire_at=next_fire_at, recurring=recurring)
+    scheduler.add(reminder)
+    return reminder
+
+@api_router.post("/reminders/{reminder_id}/snooze")
+async def snooze_reminder(
+    reminder_id: str,
+    minutes: int = Query(10, ge=1, le=SNOOZE_MAX_MINUTES),
+    current_user = Depends(get_current_user)
+):
+    """Fire the reminder again in `minutes`; a series keeps its rule and fires once extra"""
+    user_id = str(current_user['_id'])
+    now = datetime.utcnow()
+    fire_at = now + timedelta(minutes=minutes)
+    
+    version = await next_change_version(user_id)
+    series = {'$ifNull': ['$recurrence', False]}
+    reminder = await reschedule_reminder_doc(reminder_id, user_id, [{'$set': {
+        'date_time': {'$cond': [series, '$date_time', fire_at]},
+        'snoozed_until': {'$cond': [series, fire_at, None]},
+        'next_fire_at': fire_at,
+        'status': 'active',
+        'updated_at': now,
+        'version': version
+    }}])
+    return reminder_response(reminder)
+
+@api_router.post("/reminders/{reminder_id}/reschedule")
+async def reschedule_reminder(
+    reminder_id: str,
+    data: ReminderReschedule,
+    current_user = Depends(get_current_user)
+):
+    """Move the reminder (or the start of a series) to a new date_time"""
+    user_id = str(current_user['_id'])
+    
+    fields = {}
+    if 'timezone' in data.model_fields_set:
+        timezone_name = fields['timezone'] = data.timezone
+    elif data.date_time.tzinfo is None:
+        # The reminder keeps its timezone, and a wall-clock date_time is read in it
+        stored = await db.reminders.find_one({'_id': ObjectId(reminder_id), 'user_id': user_id}, {'timezone': 1})
+        if not stored:
+            raise HTTPException(status_code=404, detail="Reminder not found")
+        timezone_name = stored.get('timezone')
+    else:
+        timezone_name = None
+    date_time = reminder_time_to_utc(data.date_time, timezone_name)
+    
+    version = await next_change_version(user_id)
+    reminder = await reschedule_reminder_doc(reminder_id, user_id, {
+        '$set': {
+            **fields,
+            'date_time': date_time,
+            'next_fire_at': date_time,
+            'status': 'active',
+            'updated_at': datetime.utcnow(),
+            'version': version
+        },
+        '$unset': {'snoozed_until': ''}
+    })
+    return reminder_response(reminder)
+
 # ==================== PAYMENT ENDPOINTS ====================
 
 @api_router.post("/payments/create-order")
@@ -424,13 +2907,17 @@ async def verify_payment(payment_data: PaymentVerify, current_user = Depends(get
         expiry = datetime.utcnow() + timedelta(days=90)
     
     # Update user plan
-    await db.users.update_one(
+    user = await db.users.find_one_and_update(
         {'_id': ObjectId(user_id)},
         {'$set': {
             'plan_type': 'premium',
             'plan_expiry': expiry
-        }}
+        }, '$inc': {'plan_version': 1}},
+        projection={'plan_version': 1},
+        return_document=ReturnDocument.AFTER
     )
+    user_cache.invalidate(user_id)
+    await revocation_list.outdate_plan_claims({user_id: user['plan_version']})
     
     # Store payment record
     await db.payments.insert_one({
@@ -452,11 +2939,13 @@ async def verify_payment(payment_data: PaymentVerify, current_user = Depends(get
 # ==================== USER ENDPOINTS ====================
 
 @api_router.get("/user/plan-status")
-async def get_plan_status(current_user = Depends(get_current_user)):
+async def get_plan_status(claims: dict = Depends(get_token_claims)):
+    """Served from the signed claims alone; reminder_count is as of when the token
+    was issued, /user/profile has the current one"""
     return {
-        'plan_type': current_user.get('plan_type', 'free'),
-        'plan_expiry': current_user.get('plan_expiry'),
-        'reminder_count': current_user.get('reminder_count', 0)
+        'plan_type': claims['plan_type'],
+        'plan_expiry': claims['plan_expiry'],
+        'reminder_count': claims['reminder_count']
     }
 
 @api_router.get("/user/profile")
@@ -470,6 +2959,28 @@ async def get_profile(current_user = Depends(get_current_user)):
         'reminder_count': current_user.get('reminder_count', 0)
     }
 
+# ==================== DEVICE ENDPOINTS ====================
+
+@api_router.post("/devices/register")
+async def register_device(data: DeviceTokenRegister, claims: dict = Depends(get_token_claims)):
+    """Attach a push token to the signed-in user; a token moves with the last account that registered it"""
+    now = datetime.utcnow()
+    await db.device_tokens.update_one(
+        {'_id': data.token},
+        {
+            '$set': {'user_id': claims['user_id'], 'platform': data.platform, 'updated_at': now},
+            '$setOnInsert': {'created_at': now}
+        },
+        upsert=True
+    )
+    # With pushes off the app has to keep polling /reminders/check
+    return {'message': 'Device registered', 'push': PUSH_ENABLED}
+
+@api_router.post("/devices/unregister")
+async def unregister_device(data: DeviceTokenRemove, claims: dict = Depends(get_token_claims)):
+    await db.device_tokens.delete_one({'_id': data.token, 'user_id': claims['user_id']})
+    return {'message': 'Device unregistered'}
+
 # ==================== REFERRAL ENDPOINTS ====================
 
 @api_router.get("/referral/stats")
@@ -485,18 +2996,19 @@ async def get_referral_stats(current_user = Depends(get_current_user)):
     referral_list = [{
         'name': r['name'],
         'email': r['email'],
-        'created_at': r['created_at'].isoformat()
+        'created_at': r['created_at']
     } for r in referrals]
     
-    return {
+    return FastJSONResponse({
         'referral_code': current_user.get('referral_code', ''),
-        'referrals_count': len(referral_list),
+        'referrals_count': current_user.get('referral_count', len(referral_list)),
         'referrals': referral_list
-    }
+    })
 
 @api_router.post("/referral/validate")
-async def validate_referral_code(referral_code: str):
-    user = await db.users.find_one({'referral_code': referral_code})
+async def validate_referral_code(referral_code: str, request: Request):
+    rate_limiter.check('referral_validate', request)
+    user = await db.users.find_one({'referral_code': referral_code}, {'name': 1})
     if user:
         return {'valid': True, 'referrer_name': user['name']}
     return {'valid': False}
@@ -507,9 +3019,65 @@ async def validate_referral_code(referral_code: str):
 async def root():
     return {"message": "CallMeBack API is running"}
 
+# Seconds the readiness probe waits for a MongoDB ping
+READINESS_TIMEOUT_SECONDS = float(os.environ.get('READINESS_TIMEOUT_SECONDS', '2'))
+
+def mongo_pool_stats() -> dict:
+    checked_out = mongo_pool_metrics.checked_out
+    return {
+        'open': mongo_pool_metrics.open,
+        'checked_out': checked_out,
+        'waiting': mongo_pool_metrics.waiting,
+        'max_pool_size': MONGO_MAX_POOL_SIZE,
+        'saturation': round(checked_out / MONGO_MAX_POOL_SIZE, 4) if MONGO_MAX_POOL_SIZE else None
+    }
+
+@api_router.get("/health/live")
+async def liveness_check():
+    """The process is up and its event loop is serving requests"""
+    return {"status": "alive", "timestamp": datetime.utcnow().isoformat()}
+
+@api_router.get("/health/ready")
+async def readiness_check():
+    """Ping MongoDB and report the state of the dependencies; 503 when it cannot be reached"""
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(db.command('ping'), timeout=READINESS_TIMEOUT_SECONDS)
+        mongo = {'status': 'ok', 'latency_ms': round((time.perf_counter() - start) * 1000, 2)}
+    except asyncio.TimeoutError:
+        mongo = {'status': 'timeout', 'latency_ms': None}
+    except Exception as e:
+        mongo = {'status': 'error', 'error': type(e).__name__, 'latency_ms': None}
+    ready = mongo['status'] == 'ok'
+
+    return FastJSONResponse({
+        "status": "ready" if ready else "unavailable",
+        "timestamp": datetime.utcnow(),
+        "mongo": {**mongo, 'pool': mongo_pool_stats()},
+        "scheduler": scheduler.stats(),
+        "unique_indexes": unique_indexes_ready,
+        "event_loop_lag_seconds": round(event_loop_stats['lag_seconds'], 4)
+    }, status_code=200 if ready else 503)
+
 @api_router.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow().isoformat(),
+        "user_cache": user_cache.stats(),
+        "password_pool": password_pool.stats(),
+        "referral_codes": referral_code_stats,
+        "plan_expiry": plan_expiry_stats,
+        "revocations": revocation_list.stats(),
+        "rate_limits": rate_limiter.stats(),
+        "push": push_dispatcher.stats(),
+        "outbox": outbox.stats()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 # Include router
 app.include_router(api_router)
@@ -520,7 +3088,11 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
+app.add_middleware(MetricsMiddleware)
+if PROFILE_SAMPLE_RATE > 0 or PROFILE_TOKEN:
+    app.add_middleware(ProfilingMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -529,6 +3101,112 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def warm_mongo_pool():
+    """Open minPoolSize connections before the first request needs them"""
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*[db.command('ping') for _ in range(max(MONGO_MIN_POOL_SIZE, 1))]),
+            timeout=MONGO_SERVER_SELECTION_TIMEOUT_MS / 1000
+        )
+        logger.info(f"MongoDB pool warmed with {mongo_pool_metrics.open} connections")
+    except Exception as e:
+        logger.error(f"MongoDB pool warm-up failed: {e}")
+
+@app.on_event("startup")
+async def create_indexes():
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        logger.error(f"Index bootstrap failed: {e}")
+
+@app.on_event("startup")
+async def backfill_legacy_reminders():
+    """Reminders from before recurrence support are only found by due lookups once they have next_fire_at"""
+    try:
+        backfilled = await backfill_next_fire_at()
+        if backfilled:
+            logger.info(f"Backfilled next_fire_at on {backfilled} reminders")
+    except Exception as e:
+        logger.error(f"Backfilling next_fire_at failed: {e}")
+
+@app.on_event("startup")
+async def load_revocation_list():
+    try:
+        await revocation_list.sync()
+    except Exception as e:
+        logger.error(f"Loading the token revocation list failed: {e}")
+
+@app.on_event("startup")
+async def start_reminder_scheduler():
+    scheduler.start()
+
+@app.on_event("startup")
+async def start_outbox_workers():
+    outbox.start()
+
+@app.on_event("startup")
+async def start_push_dispatcher():
+    if PUSH_ENABLED:
+        push_dispatcher.start()
+
+@app.on_event("startup")
+async def start_job_scheduler():
+    job_scheduler.start()
+
+@app.on_event("startup")
+async def start_event_loop_monitor():
+    app.state.event_loop_monitor = asyncio.create_task(monitor_event_loop_lag())
+
+@app.on_event("shutdown")
+async def stop_reminder_scheduler():
+    await scheduler.stop()
+
+@app.on_event("shutdown")
+async def stop_outbox_workers():
+    await outbox.stop()
+
+@app.on_event("shutdown")
+async def stop_push_dispatcher():
+    await push_dispatcher.stop()
+
+@app.on_event("shutdown")
+async def stop_job_scheduler():
+    job_scheduler.shutdown(wait=False)
+
+@app.on_event("shutdown")
+async def stop_event_loop_monitor():
+    app.state.event_loop_monitor.cancel()
+
+@app.on_event("shutdown")
+async def stop_password_pool():
+    password_pool.shutdown()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+
+async def run_index_check() -> int:
+    await ensure_indexes()
+    failures = await check_query_plans()
+    for failure in failures:
+        logger.error(f"COLLSCAN: {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="CallMeBack API maintenance commands")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('check-indexes', help="Build required indexes and fail if any query shape uses a COLLSCAN")
+    commands.add_parser('backfill-referral-counts', help="Recompute referral_count for every user")
+    commands.add_parser('backfill-next-fire-at', help="Set next_fire_at on reminders created before recurrence support")
+    args = parser.parse_args()
+
+    if args.command == 'check-indexes':
+        sys.exit(asyncio.run(run_index_check()))
+    elif args.command == 'backfill-referral-counts':
+        logger.info(f"Backfilled referral_count on {asyncio.run(backfill_referral_counts())} users")
+    elif args.command == 'backfill-next-fire-at':
+        logger.info(f"Backfilled next_fire_at on {asyncio.run(backfill_next_fire_at())} reminders")
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+CallMeBack Backend Load Test
+Replays a realistic traffic mix and reports throughput, latency percentiles
+and event-loop lag per endpoint.
+
+By default the FastAPI app runs in-process on an in-memory MongoDB stand-in
+(mongomock-motor), so the whole run needs no network and no database:
+
+    python backend_loadtest.py --users 200 --devices 1000 --duration 60
+
+Use --mongo-url to run the app in-process against a local mongod instead, or
+--url to drive an already running server (e.g. a local uvicorn); event-loop
+lag is then measured on the load generator side only. Start that server with
+RATE_LIMIT_ENABLED=false, or the bursts below are throttled.
+
+The traffic mix is:
+  1. a sign-up burst of --users accounts
+  2. a login burst of the same accounts
+  3. for --duration seconds: --devices devices polling /reminders/check once
+     every --poll-interval seconds, plus --crud-workers users looping
+     create -> list -> delete with --think-time between requests
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+
+class LoadTester:
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.latencies = defaultdict(list)  # endpoint -> seconds
+        self.statuses = defaultdict(Counter)  # endpoint -> status code -> count
+        self.loop_lag = defaultdict(list)  # endpoint -> lag samples seen while it was in flight
+        self.all_lag = []
+        self.in_flight = Counter()
+        self.tokens = []
+        self.accounts = []
+        self.stopped = False
+
+    async def request(self, endpoint, method, path, **kwargs):
+        """Send one request and record its latency under `endpoint`"""
+        self.in_flight[endpoint] += 1
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+            status = response.status_code
+        except Exception as e:
+            response = None
+            status = type(e).__name__
+        finally:
+            self.in_flight[endpoint] -= 1
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        self.statuses[endpoint][status] += 1
+        return response
+
+    async def monitor_loop_lag(self, interval=0.01):
+        """Sample how late the event loop wakes a sleeping task"""
+        while not self.stopped:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = max(time.perf_counter() - start - interval, 0)
+            self.all_lag.append(lag)
+            for endpoint, count in self.in_flight.items():
+                if count:
+                    self.loop_lag[endpoint].append(lag)
+
+    # ---------- phases ----------
+
+    async def signup_burst(self):
+        run_id = uuid.uuid4().hex[:8]
+        self.accounts = [{
+            "name": f"Load User {i}",
+            "email": f"load{run_id}_{i}@example.com",
+            "password": "loadtest123"
+        } for i in range(self.args.users)]
+        await asyncio.gather(*[
+            self.request("POST /auth/register", "POST", "/auth/register", json=account)
+            for account in self.accounts
+        ])
+
+    async def login_burst(self):
+        responses = await asyncio.gather(*[
+            self.request("POST /auth/login", "POST", "/auth/login",
+                         json={"email": a["email"], "password": a["password"]})
+            for a in self.accounts
+        ])
+        self.tokens = [r.json()["token"] for r in responses if r is not None and r.status_code == 200]
+        if not self.tokens:
+            raise RuntimeError("No account could log in; is the server reachable?")
+
+    async def poll_device(self, token, deadline):
+        headers = {"Authorization": f"Bearer {token}"}
+        # Devices start at random points of the polling interval, like real clients
+        await asyncio.sleep(random.uniform(0, self.args.poll_interval))
+        while time.monotonic() < deadline:
+            await self.request("GET /reminders/check", "GET", "/reminders/check", headers=headers)
+            await asyncio.sleep(self.args.poll_interval)
+
+    async def crud_worker(self, token, deadline):
+        headers = {"Authorization": f"Bearer {token}"}
+        while time.monotonic() < deadline:
+            due = datetime.utcnow() + timedelta(minutes=random.randint(2, 240))
+            response = await self.request("POST /reminders/create", "POST", "/reminders/create", headers=headers, json={
+                "name_to_call": "Load Contact",
+                "phone_number": "+919876543210",
+                "description": "load test",
+                "date_time": due.isoformat()
+            })
+            await asyncio.sleep(self.args.think_time)
+            await self.request("GET /reminders/list", "GET", "/reminders/list", headers=headers)
+            await asyncio.sleep(self.args.think_time)
+            if response is not None and response.status_code == 200:
+                reminder_id = response.json()["id"]
+                await self.request("DELETE /reminders/{id}", "DELETE", f"/reminders/{reminder_id}", headers=headers)
+                await asyncio.sleep(self.args.think_time)
+
+    async def run(self):
+        monitor = asyncio.create_task(self.monitor_loop_lag())
+        started = time.perf_counter()
+        try:
+            print(f"Sign-up burst: {self.args.users} users")
+            await self.signup_burst()
+            print(f"Login burst: {self.args.users} users")
+            await self.login_burst()
+
+            print(f"Steady state: {self.args.devices} polling devices, "
+                  f"{self.args.crud_workers} CRUD workers for {self.args.duration}s")
+            deadline = time.monotonic() + self.args.duration
+            tasks = [
+                self.poll_device(self.tokens[i % len(self.tokens)], deadline)
+                for i in range(self.args.devices)
+            ] + [
+                self.crud_worker(self.tokens[i % len(self.tokens)], deadline)
+                for i in range(self.args.crud_workers)
+            ]
+            await asyncio.gather(*tasks)
+        finally:
+            self.stopped = True
+            await monitor
+        return time.perf_counter() - started
+
+    # ---------- reporting ----------
+
+    def report(self, elapsed):
+        header = f"{'endpoint':<26}{'count':>8}{'rps':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'lag p99':>9}  statuses"
+        print()
+        print(header)
+        print("-" * len(header))
+        for endpoint in sorted(self.latencies):
+            latencies = self.latencies[endpoint]
+            lag = self.loop_lag[endpoint]
+            statuses = ", ".join(f"{k}:{v}" for k, v in sorted(self.statuses[endpoint].items(), key=str))
+            print(f"{endpoint:<26}{len(latencies):>8}{len(latencies) / elapsed:>9.1f}"
+                  f"{percentile(latencies, 50) * 1000:>9.1f}{percentile(latencies, 90) * 1000:>9.1f}"
+                  f"{percentile(latencies, 99) * 1000:>9.1f}{max(latencies) * 1000:>9.1f}"
+                  f"{percentile(lag, 99) * 1000:>9.1f}  {statuses}")
+        total = sum(len(v) for v in self.latencies.values())
+        print()
+        print(f"Total: {total} requests in {elapsed:.1f}s ({total / elapsed:.1f} rps)")
+        print(f"Event-loop lag: p50 {percentile(self.all_lag, 50) * 1000:.1f} ms, "
+              f"p99 {percentile(self.all_lag, 99) * 1000:.1f} ms, "
+              f"max {max(self.all_lag, default=0) * 1000:.1f} ms")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def load_app(args):
+    """Import the backend in-process, wired to a local mongod or the in-memory stand-in"""
+    os.environ.setdefault("MONGO_URL", args.mongo_url or "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "callmeback_loadtest")
+    os.environ.setdefault("BCRYPT_ROUNDS", str(args.bcrypt_rounds))
+    # Every simulated client shares one address
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    sys.path.insert(0, str(Path(__file__).parent / "backend"))
+    import server
+
+    if not args.mongo_url:
+        from mongomock_motor import AsyncMongoMockClient
+        server.client = AsyncMongoMockClient()
+        server.db = server.client[os.environ["DB_NAME"]]
+    return server
+
+
+async def main(args):
+    if args.url:
+        limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+        async with httpx.AsyncClient(base_url=args.url.rstrip("/"), limits=limits, timeout=30) as client:
+            tester = LoadTester(client, args)
+            elapsed = await tester.run()
+    else:
+        server = load_app(args)
+        await server.app.router.startup()
+        try:
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest/api", timeout=30) as client:
+                tester = LoadTester(client, args)
+                elapsed = await tester.run()
+        finally:
+            await server.app.router.shutdown()
+    tester.report(elapsed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CallMeBack backend load test")
+    parser.add_argument("--url", help="Base URL of a running API (e.g. http://127.0.0.1:8001/api); default runs in-process")
+    parser.add_argument("--mongo-url", help="Local mongod for the in-process app; default is an in-memory stand-in")
+    parser.add_argument("--users", type=int, default=50, help="Accounts in the sign-up and login bursts")
+    parser.add_argument("--devices", type=int, default=200, help="Devices polling /reminders/check")
+    parser.add_argument("--crud-workers", type=int, default=10, help="Users looping create/list/delete")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of steady-state traffic")
+    parser.add_argument("--poll-interval", type=float, default=60, help="Seconds between polls of one device")
+    parser.add_argument("--think-time", type=float, default=1, help="Seconds between CRUD requests of one worker")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="BCRYPT_ROUNDS for the in-process app")
+    parser.add_argument("--max-connections", type=int, default=1000, help="HTTP connection pool size with --url")
+    parser.add_argument("--seed", type=int, help="Random seed for a repeatable run")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    asyncio.run(main(args))
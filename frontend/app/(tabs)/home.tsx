@@ -13,9 +13,6 @@ import { SafeAreaView } from 'react-native-safe-area-context';
 import { Ionicons } from '@expo/vector-icons';
 import { useAuth } from '../context/AuthContext';
 import { router, useFocusEffect } from 'expo-router';
-import Constants from 'expo-constants';
-
-const API_URL = Constants.expoConfig?.extra?.EXPO_PUBLIC_BACKEND_URL || process.env.EXPO_PUBLIC_BACKEND_URL;
 
 interface Reminder {
   id: string;
@@ -23,11 +20,12 @@ interface Reminder {
   phone_number: string;
   description: string;
   date_time: string;
+  next_fire_at?: string;
   status: string;
 }
 
 export default function HomeScreen() {
-  const { user, token, refreshUser } = useAuth();
+  const { user, token, refreshUser, authFetch } = useAuth();
   const [reminders, setReminders] = useState<Reminder[]>([]);
   const [loading, setLoading] = useState(true);
   const [refreshing, setRefreshing] = useState(false);
@@ -43,14 +41,19 @@ export default function HomeScreen() {
     if (!token) return;
 
     try {
-      const response = await fetch(`${API_URL}/api/reminders/list`, {
-        headers: { 'Authorization': `Bearer ${token}` }
-      });
+      // Follow the pagination cursor until every page is loaded
+      const all: Reminder[] = [];
+      let cursor: string | null = null;
+      do {
+        const query: string = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const response: Response = await authFetch(`/api/reminders/list${query}`);
+
+        if (!response.ok) return;
+        all.push(...(await response.json()));
+        cursor = response.headers.get('X-Next-Cursor');
+      } while (cursor);
 
-      if (response.ok) {
-        const data = await response.json();
-        setReminders(data);
-      }
+      setReminders(all);
     } catch (error) {
       console.error('Error loading reminders:', error);
     } finally {
@@ -75,10 +78,7 @@ export default function HomeScreen() {
           style: 'destructive',
           onPress: async () => {
             try {
-              const response = await fetch(`${API_URL}/api/reminders/${id}`, {
-                method: 'DELETE',
-                headers: { 'Authorization': `Bearer ${token}` }
-              });
+              const response = await authFetch(`/api/reminders/${id}`, { method: 'DELETE' });
 
               if (response.ok) {
                 loadReminders();
@@ -145,7 +145,7 @@ export default function HomeScreen() {
             {item.description}
           </Text>
         ) : null}
-        <Text style={styles.reminderTime}>{formatDate(item.date_time)}</Text>
+        <Text style={styles.reminderTime}>{formatDate(item.next_fire_at || item.date_time)}</Text>
       </View>
       <TouchableOpacity
         style={styles.deleteButton}
@@ -11,9 +11,6 @@ import {
 import { SafeAreaView } from 'react-native-safe-area-context';
 import { Ionicons } from '@expo/vector-icons';
 import { useAuth } from '../context/AuthContext';
-import Constants from 'expo-constants';
-
-const API_URL = Constants.expoConfig?.extra?.EXPO_PUBLIC_BACKEND_URL || process.env.EXPO_PUBLIC_BACKEND_URL;
 
 const plans = [
   {
@@ -42,7 +39,7 @@ const features = [
 ];
 
 export default function SubscriptionScreen() {
-  const { user, token, refreshUser } = useAuth();
+  const { user, refreshUser, authFetch } = useAuth();
   const [selectedPlan, setSelectedPlan] = useState('monthly');
   const [loading, setLoading] = useState(false);
 
@@ -52,12 +49,9 @@ export default function SubscriptionScreen() {
       const plan = plans.find(p => p.id === selectedPlan);
       
       // Create order
-      const orderResponse = await fetch(`${API_URL}/api/payments/create-order`, {
+      const orderResponse = await authFetch('/api/payments/create-order', {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'Authorization': `Bearer ${token}`
-        },
+        headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
           amount: plan!.price * 100, // Convert to paise
           plan_type: selectedPlan
@@ -75,12 +69,9 @@ export default function SubscriptionScreen() {
             text: 'OK',
             onPress: async () => {
               // Verify payment
-              const verifyResponse = await fetch(`${API_URL}/api/payments/verify-payment`, {
+              const verifyResponse = await authFetch('/api/payments/verify-payment', {
                 method: 'POST',
-                headers: {
-                  'Content-Type': 'application/json',
-                  'Authorization': `Bearer ${token}`
-                },
+                headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
                   order_id: orderData.order_id,
                   payment_id: 'pay_test_' + Date.now(),
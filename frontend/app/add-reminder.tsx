@@ -16,14 +16,11 @@ import { SafeAreaView } from 'react-native-safe-area-context';
 import { Ionicons } from '@expo/vector-icons';
 import { router } from 'expo-router';
 import { useAuth } from './context/AuthContext';
-import Constants from 'expo-constants';
 import DateTimePicker from '@react-native-community/datetimepicker';
 import * as Contacts from 'expo-contacts';
 
-const API_URL = Constants.expoConfig?.extra?.EXPO_PUBLIC_BACKEND_URL || process.env.EXPO_PUBLIC_BACKEND_URL;
-
 export default function AddReminderScreen() {
-  const { token } = useAuth();
+  const { authFetch } = useAuth();
   const [name, setName] = useState('');
   const [phone, setPhone] = useState('');
   const [description, setDescription] = useState('');
@@ -82,17 +79,15 @@ export default function AddReminderScreen() {
 
     setLoading(true);
     try {
-      const response = await fetch(`${API_URL}/api/reminders/create`, {
+      const response = await authFetch('/api/reminders/create', {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'Authorization': `Bearer ${token}`
-        },
+        headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
           name_to_call: name,
           phone_number: phone,
           description: description,
-          date_time: date.toISOString()
+          date_time: date.toISOString(),
+          timezone: Intl.DateTimeFormat().resolvedOptions().timeZone
         })
       });
 
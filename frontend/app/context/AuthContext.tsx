@@ -1,4 +1,4 @@
-import React, { createContext, useState, useContext, useEffect } from 'react';
+import React, { createContext, useState, useContext, useEffect, useRef } from 'react';
 import AsyncStorage from '@react-native-async-storage/async-storage';
 import Constants from 'expo-constants';
 import { router } from 'expo-router';
@@ -24,6 +24,17 @@ interface AuthContextType {
   googleLogin: (idToken: string, email: string, name: string) => Promise<void>;
   logout: () => Promise<void>;
   refreshUser: () => Promise<void>;
+  authFetch: (path: string, init?: RequestInit) => Promise<Response>;
+}
+
+// Renew the access token this long before it expires
+const REFRESH_MARGIN_MS = 60 * 1000;
+
+interface Session {
+  token: string;
+  refresh_token: string;
+  expires_in: number;
+  user?: User;
 }
 
 const AuthContext = createContext<AuthContextType | undefined>(undefined);
@@ -32,9 +43,16 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
   const [user, setUser] = useState<User | null>(null);
   const [token, setToken] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
+  const refreshTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
+  const pendingRefresh = useRef<Promise<string | null> | null>(null);
+  // The current access token for authFetch, which may run from a stale render
+  const tokenRef = useRef<string | null>(null);
 
   useEffect(() => {
     loadStoredAuth();
+    return () => {
+      if (refreshTimer.current) clearTimeout(refreshTimer.current);
+    };
   }, []);
 
   const loadStoredAuth = async () => {
@@ -43,8 +61,11 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
       const storedUser = await AsyncStorage.getItem('user');
       
       if (storedToken && storedUser) {
+        tokenRef.current = storedToken;
         setToken(storedToken);
         setUser(JSON.parse(storedUser));
+        // Access tokens are short-lived, so start every launch with a fresh one
+        await refreshSession();
       }
     } catch (error) {
       console.error('Error loading auth:', error);
@@ -53,6 +74,87 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
     }
   };
 
+  const saveSession = async (session: Session) => {
+    await AsyncStorage.setItem('token', session.token);
+    await AsyncStorage.setItem('refresh_token', session.refresh_token);
+    if (session.user) {
+      await AsyncStorage.setItem('user', JSON.stringify(session.user));
+      setUser(session.user);
+    }
+    tokenRef.current = session.token;
+    setToken(session.token);
+
+    if (refreshTimer.current) clearTimeout(refreshTimer.current);
+    refreshTimer.current = setTimeout(
+      refreshSession,
+      Math.max(session.expires_in * 1000 - REFRESH_MARGIN_MS, 0)
+    );
+  };
+
+  const clearSession = async () => {
+    if (refreshTimer.current) clearTimeout(refreshTimer.current);
+    await AsyncStorage.multiRemove(['token', 'refresh_token', 'user']);
+    tokenRef.current = null;
+    setToken(null);
+    setUser(null);
+  };
+
+  // Swap the refresh token for a new token pair; returns the new access token.
+  // Refresh tokens are single-use, so callers that overlap share one refresh
+  // instead of the second one being refused and signing the user out.
+  const refreshSession = (): Promise<string | null> => {
+    if (!pendingRefresh.current) {
+      pendingRefresh.current = swapRefreshToken().finally(() => {
+        pendingRefresh.current = null;
+      });
+    }
+    return pendingRefresh.current;
+  };
+
+  const swapRefreshToken = async (): Promise<string | null> => {
+    const refreshToken = await AsyncStorage.getItem('refresh_token');
+    if (!refreshToken) {
+      await clearSession();
+      return null;
+    }
+
+    try {
+      const response = await fetch(`${API_URL}/api/auth/refresh`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ refresh_token: refreshToken })
+      });
+
+      if (response.status === 401) {
+        await clearSession();
+        router.replace('/auth/login');
+        return null;
+      }
+      if (!response.ok) return null;
+
+      const data: Session = await response.json();
+      await saveSession(data);
+      return data.token;
+    } catch (error) {
+      console.error('Error refreshing session:', error);
+      return null;
+    }
+  };
+
+  // Call an authenticated API path. An expired token, or one issued before a
+  // plan change, gets a 401; the session is then refreshed once and the call retried.
+  const authFetch = async (path: string, init: RequestInit = {}): Promise<Response> => {
+    const send = (accessToken: string | null) => fetch(`${API_URL}${path}`, {
+      ...init,
+      headers: { ...(init.headers as Record<string, string>), 'Authorization': `Bearer ${accessToken}` }
+    });
+
+    const response = await send(tokenRef.current);
+    if (response.status !== 401) return response;
+    const freshToken = await refreshSession();
+    return freshToken ? send(freshToken) : response;
+  };
+
   const login = async (email: string, password: string) => {
     try {
       const response = await fetch(`${API_URL}/api/auth/login`, {
@@ -67,11 +169,7 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
         throw new Error(data.detail || 'Login failed');
       }
 
-      await AsyncStorage.setItem('token', data.token);
-      await AsyncStorage.setItem('user', JSON.stringify(data.user));
-      
-      setToken(data.token);
-      setUser(data.user);
+      await saveSession(data);
     } catch (error: any) {
       throw error;
     }
@@ -96,11 +194,7 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
         throw new Error(data.detail || 'Signup failed');
       }
 
-      await AsyncStorage.setItem('token', data.token);
-      await AsyncStorage.setItem('user', JSON.stringify(data.user));
-      
-      setToken(data.token);
-      setUser(data.user);
+      await saveSession(data);
     } catch (error: any) {
       throw error;
     }
@@ -120,11 +214,7 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
         throw new Error(data.detail || 'Google login failed');
       }
 
-      await AsyncStorage.setItem('token', data.token);
-      await AsyncStorage.setItem('user', JSON.stringify(data.user));
-      
-      setToken(data.token);
-      setUser(data.user);
+      await saveSession(data);
     } catch (error: any) {
       throw error;
     }
@@ -132,10 +222,17 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
 
   const logout = async () => {
     try {
-      await AsyncStorage.removeItem('token');
-      await AsyncStorage.removeItem('user');
-      setToken(null);
-      setUser(null);
+      // Revoke both tokens and stop pushes to this device server-side;
+      // signing out locally must not depend on it
+      const refreshToken = await AsyncStorage.getItem('refresh_token');
+      const deviceToken = await AsyncStorage.getItem('push_token');
+      fetch(`${API_URL}/api/auth/logout`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
+        body: JSON.stringify({ refresh_token: refreshToken, device_token: deviceToken })
+      }).catch(() => {});
+
+      await clearSession();
       // Force navigation to login
       setTimeout(() => {
         router.replace('/auth/login');
@@ -149,10 +246,7 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
     if (!token) return;
     
     try {
-      const response = await fetch(`${API_URL}/api/user/profile`, {
-        headers: { 'Authorization': `Bearer ${token}` }
-      });
-
+      const response = await authFetch('/api/user/profile');
       const data = await response.json();
       
       if (response.ok) {
@@ -165,7 +259,7 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
   };
 
   return (
-    <AuthContext.Provider value={{ user, token, loading, login, signup, googleLogin, logout, refreshUser }}>
+    <AuthContext.Provider value={{ user, token, loading, login, signup, googleLogin, logout, refreshUser, authFetch }}>
       {children}
     </AuthContext.Provider>
   );
@@ -2,12 +2,10 @@ import React, { createContext, useContext, useEffect, useState, useRef } from 'r
 import * as Notifications from 'expo-notifications';
 import * as Device from 'expo-device';
 import { Platform } from 'react-native';
+import AsyncStorage from '@react-native-async-storage/async-storage';
 import { useAuth } from './AuthContext';
-import Constants from 'expo-constants';
 import { router } from 'expo-router';
 
-const API_URL = Constants.expoConfig?.extra?.EXPO_PUBLIC_BACKEND_URL || process.env.EXPO_PUBLIC_BACKEND_URL;
-
 // Configure notification behavior
 Notifications.setNotificationHandler({
   handleNotification: async () => ({
@@ -26,7 +24,8 @@ const NotificationContext = createContext<NotificationContextType | undefined>(u
 
 export function NotificationProvider({ children }: { children: React.ReactNode }) {
   const [expoPushToken, setExpoPushToken] = useState<string | null>(null);
-  const { token } = useAuth();
+  const [pushRegistered, setPushRegistered] = useState(false);
+  const { token, authFetch } = useAuth();
   const notificationListener = useRef<any>();
   const responseListener = useRef<any>();
 
@@ -59,16 +58,36 @@ export function NotificationProvider({ children }: { children: React.ReactNode }
     };
   }, []);
 
-  // Poll for reminders every minute
+  // Let the backend push due reminders to this device
   useEffect(() => {
-    if (!token) return;
+    if (!token || !expoPushToken) return;
+
+    setPushRegistered(false);
+    authFetch('/api/devices/register', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ token: expoPushToken, platform: Platform.OS })
+    })
+      .then(async response => {
+        if (!response.ok) return;
+        await AsyncStorage.setItem('push_token', expoPushToken);
+        // Keep polling unless the backend actually sends pushes
+        const result = await response.json();
+        setPushRegistered(result.push === true);
+      })
+      .catch(error => console.error('Error registering push token:', error));
+  }, [token, expoPushToken]);
+
+  // Poll for reminders every minute while pushes cannot reach this device
+  useEffect(() => {
+    if (!token || pushRegistered) return;
 
     const interval = setInterval(() => {
       checkReminders();
     }, 60000); // Check every minute
 
     return () => clearInterval(interval);
-  }, [token]);
+  }, [token, pushRegistered]);
 
   const registerForPushNotifications = async () => {
     if (!Device.isDevice) {
@@ -101,9 +120,7 @@ export function NotificationProvider({ children }: { children: React.ReactNode }
     if (!token) return;
 
     try {
-      const response = await fetch(`${API_URL}/api/reminders/check`, {
-        headers: { 'Authorization': `Bearer ${token}` }
-      });
+      const response = await authFetch('/api/reminders/check');
 
       if (response.ok) {
         const reminders = await response.json();
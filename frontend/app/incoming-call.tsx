@@ -14,16 +14,15 @@ import { SafeAreaView } from 'react-native-safe-area-context';
 import { Ionicons } from '@expo/vector-icons';
 import { router, useLocalSearchParams } from 'expo-router';
 import { useAuth } from './context/AuthContext';
-import Constants from 'expo-constants';
 
-const API_URL = Constants.expoConfig?.extra?.EXPO_PUBLIC_BACKEND_URL || process.env.EXPO_PUBLIC_BACKEND_URL;
 const { width } = Dimensions.get('window');
 const SLIDE_WIDTH = width - 80;
 const BUTTON_SIZE = 60;
+const SNOOZE_MINUTES = 10;
 
 export default function IncomingCallScreen() {
   const params = useLocalSearchParams();
-  const { token } = useAuth();
+  const { token, authFetch } = useAuth();
   const [showButtons, setShowButtons] = useState(false);
   const pulseAnim = useRef(new Animated.Value(1)).current;
   const slideCallAnim = useRef(new Animated.Value(0)).current;
@@ -65,10 +64,7 @@ export default function IncomingCallScreen() {
       
       // Mark reminder as completed
       if (reminderId && token) {
-        await fetch(`${API_URL}/api/reminders/${reminderId}/complete`, {
-          method: 'POST',
-          headers: { 'Authorization': `Bearer ${token}` }
-        });
+        await authFetch(`/api/reminders/${reminderId}/complete`, { method: 'POST' });
       }
       
       router.back();
@@ -80,10 +76,19 @@ export default function IncomingCallScreen() {
   const handleCancel = async () => {
     // Mark reminder as completed
     if (reminderId && token) {
-      await fetch(`${API_URL}/api/reminders/${reminderId}/complete`, {
-        method: 'POST',
-        headers: { 'Authorization': `Bearer ${token}` }
-      });
+      await authFetch(`/api/reminders/${reminderId}/complete`, { method: 'POST' });
+    }
+    router.back();
+  };
+
+  const handleSnooze = async () => {
+    // The server fires the reminder again; nothing has to be recreated
+    if (reminderId && token) {
+      try {
+        await authFetch(`/api/reminders/${reminderId}/snooze?minutes=${SNOOZE_MINUTES}`, { method: 'POST' });
+      } catch (error) {
+        Alert.alert('Error', 'Could not snooze the reminder');
+      }
     }
     router.back();
   };
@@ -197,6 +202,11 @@ export default function IncomingCallScreen() {
               </Animated.View>
             </View>
 
+            <TouchableOpacity style={styles.snoozeButton} onPress={handleSnooze}>
+              <Ionicons name="alarm-outline" size={20} color="#ffffff" />
+              <Text style={styles.snoozeText}>Snooze {SNOOZE_MINUTES} min</Text>
+            </TouchableOpacity>
+
             <TouchableOpacity style={styles.dismissButton} onPress={handleCancel}>
               <Text style={styles.dismissText}>Dismiss</Text>
             </TouchableOpacity>
@@ -309,6 +319,20 @@ const styles = StyleSheet.create({
   cancelButton: {
     backgroundColor: '#DC2626',
   },
+  snoozeButton: {
+    flexDirection: 'row',
+    alignItems: 'center',
+    justifyContent: 'center',
+    height: 48,
+    borderRadius: 24,
+    backgroundColor: '#374151',
+  },
+  snoozeText: {
+    color: '#ffffff',
+    fontSize: 16,
+    fontWeight: '600',
+    marginLeft: 8,
+  },
   dismissButton: {
     marginTop: 20,
     alignSelf: 'center',
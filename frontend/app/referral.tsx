@@ -13,11 +13,8 @@ import { SafeAreaView } from 'react-native-safe-area-context';
 import { Ionicons } from '@expo/vector-icons';
 import { router } from 'expo-router';
 import { useAuth } from './context/AuthContext';
-import Constants from 'expo-constants';
 import * as Clipboard from 'expo-clipboard';
 
-const API_URL = Constants.expoConfig?.extra?.EXPO_PUBLIC_BACKEND_URL || process.env.EXPO_PUBLIC_BACKEND_URL;
-
 interface ReferralData {
   referral_code: string;
   referrals_count: number;
@@ -29,7 +26,7 @@ interface ReferralData {
 }
 
 export default function ReferralScreen() {
-  const { user, token, refreshUser } = useAuth();
+  const { user, refreshUser, authFetch } = useAuth();
   const [referralData, setReferralData] = useState<ReferralData | null>(null);
   const [loading, setLoading] = useState(true);
 
@@ -39,9 +36,7 @@ export default function ReferralScreen() {
 
   const loadReferralData = async () => {
     try {
-      const response = await fetch(`${API_URL}/api/referral/stats`, {
-        headers: { 'Authorization': `Bearer ${token}` }
-      });
+      const response = await authFetch('/api/referral/stats');
 
       if (response.ok) {
         const data = await response.json();
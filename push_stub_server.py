@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+CallMeBack Push Stub Server
+A local stand-in for the Expo push API, so the backend's push dispatch
+pipeline can be tested and benchmarked without network access.
+
+Serve it and point the backend at it:
+
+    python push_stub_server.py serve --port 8090
+    PUSH_API_URL=http://127.0.0.1:8090/--/api/v2/push/send uvicorn server:app
+
+or benchmark the dispatcher in-process against it (the backend runs on the
+in-memory MongoDB stand-in, like backend_loadtest.py):
+
+    python push_stub_server.py bench --notifications 20000 --users 2000
+
+The in-memory stand-in rescans TTL collections on every insert, so the
+receipts claimed per batch soon dominate a long run; use --mongo-url for
+figures representative of production.
+
+The stub answers like Expo: a batch of more than 100 messages is rejected,
+every message gets a ticket, and tokens containing "dead" get a
+DeviceNotRegistered error. --latency-ms, --error-rate and --throttle-rate
+add response time, 503s and 429s so retries can be exercised.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import time
+import uuid
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from starlette.responses import JSONResponse
+
+from backend_loadtest import load_app, percentile
+
+MAX_BATCH = 100
+
+
+class PushStub:
+    def __init__(self, args):
+        self.args = args
+        self.calls = Counter()  # response status -> count
+        self.batch_sizes = []
+        self.received = {}  # reminder id -> first time a message for it was accepted
+
+    def build_app(self):
+        app = FastAPI()
+
+        @app.post("/--/api/v2/push/send")
+        async def send(request: Request):
+            messages = await request.json()
+            if isinstance(messages, dict):
+                messages = [messages]
+            if self.args.latency_ms:
+                await asyncio.sleep(self.args.latency_ms / 1000)
+            if len(messages) > MAX_BATCH:
+                return self.respond(400, {"errors": [{
+                    "code": "PUSH_TOO_MANY_NOTIFICATIONS",
+                    "message": f"You are trying to send more than {MAX_BATCH} push notifications in one request."
+                }]})
+            roll = random.random()
+            if roll < self.args.throttle_rate:
+                return self.respond(429, {"errors": [{"code": "TOO_MANY_REQUESTS"}]})
+            if roll < self.args.throttle_rate + self.args.error_rate:
+                return self.respond(503, {"errors": [{"code": "INTERNAL_SERVER_ERROR"}]})
+
+            self.batch_sizes.append(len(messages))
+            now = time.monotonic()
+            tickets = []
+            for message in messages:
+                if "dead" in message.get("to", ""):
+                    tickets.append({
+                        "status": "error",
+                        "message": f"\"{message['to']}\" is not a registered push notification recipient",
+                        "details": {"error": "DeviceNotRegistered"}
+                    })
+                    continue
+                reminder_id = (message.get("data") or {}).get("reminderId")
+                self.received.setdefault(reminder_id, now)
+                tickets.append({"status": "ok", "id": str(uuid.uuid4())})
+            return self.respond(200, {"data": tickets})
+
+        return app
+
+    def respond(self, status, body):
+        self.calls[status] += 1
+        return JSONResponse(body, status_code=status)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def serve(stub, port):
+    config = uvicorn.Config(stub.build_app(), host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            await task
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+async def bench(args):
+    stub = PushStub(args)
+    port = args.port or free_port()
+    stub_server, stub_task = await serve(stub, port)
+
+    os.environ["PUSH_API_URL"] = f"http://127.0.0.1:{port}/--/api/v2/push/send"
+    os.environ.setdefault("PUSH_ENABLED", "true")
+    server = load_app(args)
+    await server.app.router.startup()
+    dispatcher = server.push_dispatcher
+    try:
+        user_ids = [uuid.uuid4().hex[:24] for _ in range(args.users)]
+        devices = [{
+            "_id": f"ExponentPushToken[{'dead' if random.random() < args.dead_fraction else 'live'}-{uuid.uuid4().hex}]",
+            "user_id": user_id
+        } for user_id in user_ids for _ in range(args.devices_per_user)]
+        await server.db.device_tokens.insert_many(devices)
+
+        print(f"Dispatching {args.notifications} notifications to {args.users} users "
+              f"with {args.devices_per_user} device(s) each ({args.dead_fraction:.0%} dead tokens)")
+        enqueued_at = {}
+        started = time.perf_counter()
+        for i in range(args.notifications):
+            while dispatcher.queue.full():
+                await asyncio.sleep(0.001)
+            reminder_id = uuid.uuid4().hex[:24]
+            enqueued_at[reminder_id] = time.monotonic()
+            dispatcher.enqueue(user_ids[i % len(user_ids)], {
+                "id": reminder_id,
+                "name_to_call": "Bench Contact",
+                "phone_number": "+919876543210",
+                "description": "push bench",
+                "date_time": "2000-01-01T00:00:00"
+            })
+        await dispatcher.queue.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        await server.app.router.shutdown()
+        stub_server.should_exit = True
+        await stub_task
+
+    latencies = [stub.received[k] - t for k, t in enqueued_at.items() if k in stub.received]
+    stats = dispatcher.stats()
+    batches = stub.batch_sizes
+    print()
+    print(f"Elapsed: {elapsed:.2f}s")
+    print(f"Messages accepted: {stats['sent']} ({stats['sent'] / elapsed:.0f}/s), "
+          f"failed: {stats['failed']}, dropped: {stats['dropped']}, tokens pruned: {stats['pruned_tokens']}")
+    print(f"API calls: {sum(stub.calls.values())} "
+          f"({', '.join(f'{k}:{v}' for k, v in sorted(stub.calls.items()))}), "
+          f"mean batch {sum(batches) / max(len(batches), 1):.1f} messages")
+    print(f"Enqueue to first accepted message: p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p90 {percentile(latencies, 90) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} ms, "
+          f"max {max(latencies, default=0) * 1000:.1f} ms")
+
+
+async def serve_forever(args):
+    stub = PushStub(args)
+    server, task = await serve(stub, args.port or 8090)
+    print(f"Push stub listening on http://127.0.0.1:{server.config.port}/--/api/v2/push/send")
+    await task
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CallMeBack push stub server")
+    parser.add_argument("mode", choices=["serve", "bench"], help="Serve the stub, or benchmark the dispatcher against it")
+    parser.add_argument("--port", type=int, help="Stub port (serve defaults to 8090, bench to a free port)")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Added response time of each API call")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of API calls answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="Fraction of API calls answered with 429")
+    parser.add_argument("--notifications", type=int, default=10000, help="Due reminders to dispatch (bench)")
+    parser.add_argument("--users", type=int, default=1000, help="Users the reminders belong to (bench)")
+    parser.add_argument("--devices-per-user", type=int, default=1, help="Registered devices per user (bench)")
+    parser.add_argument("--dead-fraction", type=float, default=0.01, help="Fraction of uninstalled devices (bench)")
+    parser.add_argument("--mongo-url", help="Local mongod for the in-process app; default is an in-memory stand-in")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="BCRYPT_ROUNDS for the in-process app")
+    parser.add_argument("--seed", type=int, help="Random seed for a repeatable run")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    asyncio.run(bench(args) if args.mode == "bench" else serve_forever(args))
@@ -0,0 +1,8 @@
+import os
+import sys
+from pathlib import Path
+
+# server.py reads its settings at import time; no database is contacted by the benchmarks
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'callmeback_benchmark')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
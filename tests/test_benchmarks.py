@@ -0,0 +1,91 @@
+"""
+Micro-benchmarks for the CPU-bound pieces of the request hot paths.
+
+Save a baseline, then compare later runs against it and fail on regressions:
+
+    pytest tests/test_benchmarks.py --benchmark-autosave
+    pytest tests/test_benchmarks.py --benchmark-compare --benchmark-compare-fail=mean:10%
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+from bson import ObjectId
+
+import server
+
+USER_ID = str(ObjectId())
+USER = {'_id': ObjectId(USER_ID), 'plan_type': 'free', 'plan_expiry': None, 'reminder_count': 3, 'plan_version': 0}
+
+
+def make_reminders(count):
+    now = datetime(2030, 1, 1, 9, 30)
+    return [{
+        '_id': ObjectId(),
+        'user_id': USER_ID,
+        'name_to_call': f'Contact {i}',
+        'phone_number': '+919876543210',
+        'description': 'Weekly catch-up call',
+        'date_time': now + timedelta(minutes=15 * i),
+        'status': 'active',
+        'created_at': now
+    } for i in range(count)]
+
+
+def test_create_access_token(benchmark):
+    benchmark(server.create_access_token, USER)
+
+
+def test_jwt_decode(benchmark):
+    token = server.create_access_token(USER)
+    benchmark(jwt.decode, token, server.JWT_SECRET, algorithms=[server.JWT_ALGORITHM])
+
+
+def test_get_current_user_cached(benchmark):
+    """Token decode plus user cache hit, the common path of every authenticated request"""
+    token = server.create_access_token(USER)
+    server.user_cache.set(USER_ID, {'_id': ObjectId(USER_ID), 'name': 'Bench'}, server.user_cache.epoch(USER_ID))
+    loop = asyncio.new_event_loop()
+    try:
+        benchmark(lambda: loop.run_until_complete(server.get_current_user(f'Bearer {token}')))
+    finally:
+        loop.close()
+        server.user_cache.invalidate(USER_ID)
+
+
+@pytest.mark.parametrize('rounds', [4, 10, 12])
+def test_hash_password(benchmark, rounds):
+    benchmark.pedantic(server.hash_password, args=('correct horse', rounds), rounds=5, iterations=1)
+
+
+@pytest.mark.parametrize('rounds', [4, 10, 12])
+def test_verify_password(benchmark, rounds):
+    hashed = server.hash_password('correct horse', rounds)
+    benchmark.pedantic(server.verify_password, args=('correct horse', hashed), rounds=5, iterations=1)
+
+
+def test_reminder_list_serialization(benchmark):
+    """A full 100-item /reminders/list page: document conversion plus JSON rendering"""
+    reminders = make_reminders(100)
+    benchmark(lambda: server.FastJSONResponse([server.reminder_response(r) for r in reminders]).body)
+
+
+def test_reminder_check_payload(benchmark):
+    reminders = make_reminders(10)
+    benchmark(lambda: [server.reminder_check_payload(r) for r in reminders])
+
+
+def test_reminder_create_validation(benchmark):
+    payload = {
+        'name_to_call': 'Mom',
+        'phone_number': '+919876543210',
+        'description': 'Sunday call',
+        'date_time': '2030-01-01T09:30:00.000Z'
+    }
+    benchmark(server.ReminderCreate.model_validate, payload)
+
+
+def test_generate_referral_code(benchmark):
+    benchmark(server.generate_referral_code)
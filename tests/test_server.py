@@ -0,0 +1,1087 @@
+"""
+Unit tests for the scheduling, caching, rate limiting and quota logic.
+
+Database-backed tests run against an in-memory MongoDB stand-in
+(mongomock-motor), so no server is needed:
+
+    pytest tests/test_server.py
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import orjson
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from starlette.requests import Request
+
+import server
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient()['callmeback_test']
+    monkeypatch.setattr(server, 'db', database)
+    return database
+
+
+async def insert_user(db, **fields):
+    user = {
+        '_id': ObjectId(),
+        'plan_type': 'free',
+        'plan_expiry': None,
+        'reminder_count': 0,
+        'change_version': 0,
+        'referral_count': 0,
+        'referral_reward_given': False,
+        'referred_by': None,
+        **fields
+    }
+    await db.users.insert_one(user)
+    return str(user['_id'])
+
+
+async def get_user(db, user_id):
+    return await db.users.find_one({'_id': ObjectId(user_id)})
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    schedule = server.ReminderScheduler(
+        server.SCHEDULER_LOOKAHEAD, server.SCHEDULER_HORIZON,
+        server.SCHEDULER_RECONCILE_INTERVAL, server.SCHEDULER_SYNC_INTERVAL
+    )
+    monkeypatch.setattr(server, 'scheduler', schedule)
+    return schedule
+
+
+# ==================== RECURRENCE ====================
+
+def occurrences(start, rule, after=None, limit=10):
+    found = []
+    for occurrence in server.iter_occurrences(start, rule, after or start):
+        if len(found) == limit:
+            break
+        found.append(occurrence)
+    return found
+
+
+def test_daily_count():
+    start = datetime(2030, 1, 1, 9, 0)
+    assert occurrences(start, {'freq': 'daily', 'count': 3}) == [
+        datetime(2030, 1, 1, 9, 0), datetime(2030, 1, 2, 9, 0), datetime(2030, 1, 3, 9, 0)
+    ]
+
+
+def test_count_is_kept_when_starting_late_in_the_series():
+    start = datetime(2030, 1, 1, 9, 0)
+    rule = {'freq': 'daily', 'interval': 2, 'count': 5}
+    assert occurrences(start, rule, after=datetime(2030, 1, 6)) == [
+        datetime(2030, 1, 7, 9, 0), datetime(2030, 1, 9, 9, 0)
+    ]
+
+
+def test_weekly_until_is_inclusive():
+    start = datetime(2030, 1, 1, 9, 0)
+    rule = {'freq': 'weekly', 'until': datetime(2030, 1, 15, 9, 0)}
+    assert occurrences(start, rule) == [
+        datetime(2030, 1, 1, 9, 0), datetime(2030, 1, 8, 9, 0), datetime(2030, 1, 15, 9, 0)
+    ]
+
+
+def test_weekly_by_weekday():
+    # 2030-01-02 is a Wednesday; the series also runs on Mondays
+    start = datetime(2030, 1, 2, 18, 0)
+    rule = {'freq': 'weekly', 'by_weekday': [0, 2], 'count': 4}
+    assert occurrences(start, rule) == [
+        datetime(2030, 1, 2, 18, 0), datetime(2030, 1, 7, 18, 0),
+        datetime(2030, 1, 9, 18, 0), datetime(2030, 1, 14, 18, 0)
+    ]
+
+
+def test_weekly_by_weekday_every_other_week():
+    start = datetime(2030, 1, 7, 18, 0)  # a Monday
+    rule = {'freq': 'weekly', 'interval': 2, 'by_weekday': [0, 4]}
+    assert occurrences(start, rule, after=datetime(2030, 1, 12), limit=3) == [
+        datetime(2030, 1, 21, 18, 0), datetime(2030, 1, 25, 18, 0), datetime(2030, 2, 4, 18, 0)
+    ]
+
+
+@pytest.mark.parametrize('day, expected_months', [
+    (29, [1, 3, 4]),  # no 29 February in 2030
+    (30, [1, 3, 4]),
+    (31, [1, 3, 5]),
+])
+def test_monthly_late_days_skip_short_months(day, expected_months):
+    start = datetime(2030, 1, day, 8, 0)
+    assert occurrences(start, {'freq': 'monthly'}, limit=3) == [
+        datetime(2030, month, day, 8, 0) for month in expected_months
+    ]
+
+
+def test_monthly_count_on_day_31_counts_only_real_occurrences():
+    start = datetime(2030, 1, 31, 8, 0)
+    rule = {'freq': 'monthly', 'count': 3}
+    assert occurrences(start, rule, after=datetime(2030, 4, 1)) == [datetime(2030, 5, 31, 8, 0)]
+
+
+def test_fire_times_keep_local_time_across_dst():
+    # 10:00 in London is 10:00 UTC in January and 09:00 UTC in July
+    reminder = {
+        'date_time': datetime(2030, 1, 6, 10, 0),  # a Sunday
+        'timezone': 'Europe/London',
+        'recurrence': {'freq': 'weekly'}
+    }
+    assert next(server.fire_times(reminder, datetime(2030, 7, 1))) == datetime(2030, 7, 7, 9, 0)
+    assert next(server.fire_times(reminder, datetime(2030, 1, 7))) == datetime(2030, 1, 13, 10, 0)
+
+
+def test_fire_times_merge_a_snooze_into_the_series():
+    reminder = {
+        'date_time': datetime(2030, 1, 1, 9, 0),
+        'recurrence': {'freq': 'daily'},
+        'snoozed_until': datetime(2030, 1, 1, 9, 10)
+    }
+    times = server.fire_times(reminder, datetime(2030, 1, 1, 9, 5))
+    assert [next(times), next(times)] == [datetime(2030, 1, 1, 9, 10), datetime(2030, 1, 2, 9, 0)]
+
+
+def test_next_fire_time_of_a_finished_series_keeps_its_last_occurrence():
+    reminder = {'date_time': datetime(2030, 1, 1, 9, 0), 'recurrence': {'freq': 'daily', 'count': 2}}
+    assert server.next_fire_time(reminder, datetime(2030, 2, 1)) == (datetime(2030, 1, 2, 9, 0), False)
+
+
+def test_startup_backfills_legacy_reminders(db):
+    async def scenario():
+        due = datetime.utcnow().replace(microsecond=0)
+        await db.reminders.insert_one({'user_id': 'u1', 'date_time': due, 'status': 'active'})
+        await server.backfill_legacy_reminders()
+        return due, await db.reminders.find_one({})
+
+    due, reminder = run(scenario())
+    assert reminder['next_fire_at'] == due
+    assert reminder['recurring'] is False
+
+
+def test_recurrence_sweep_clears_series_that_are_no_longer_active(db):
+    async def scenario():
+        past = datetime.utcnow().replace(microsecond=0) - timedelta(days=3)
+        for status in ('active', 'completed', 'deleted'):
+            await db.reminders.insert_one({
+                'user_id': 'u1', 'status': status, 'date_time': past, 'next_fire_at': past,
+                'recurrence': {'freq': 'daily'}, 'recurring': True
+            })
+        await server.advance_recurring_reminders()
+        return past, {r['status']: r async for r in db.reminders.find({})}
+
+    past, reminders = run(scenario())
+    assert reminders['active']['next_fire_at'] > datetime.utcnow()
+    assert reminders['active']['recurring'] is True
+    for status in ('completed', 'deleted'):
+        assert reminders[status]['next_fire_at'] == past
+        assert reminders[status]['recurring'] is False
+
+
+# ==================== INDEXES ====================
+
+def test_ensure_indexes_builds_missing_indexes(db):
+    async def scenario():
+        await server.ensure_indexes()
+        return await db.users.index_information(), server.unique_indexes_ready
+
+    existing, ready = run(scenario())
+    assert existing['referral_code_unique']['sparse'] is True
+    assert ready is True
+
+
+def test_ensure_indexes_never_drops_a_drifted_unique_index(db, monkeypatch):
+    async def scenario():
+        await db.users.create_index([('referral_code', 1)], name='referral_code_unique', unique=True)
+        await server.ensure_indexes()
+        return await db.users.index_information(), server.unique_indexes_ready
+
+    monkeypatch.setattr(server, 'unique_indexes_ready', True)
+    existing, ready = run(scenario())
+    assert 'sparse' not in existing['referral_code_unique']
+    assert ready is False
+
+
+def test_ensure_indexes_carries_on_after_a_failed_rebuild(db, monkeypatch):
+    async def scenario():
+        await db.rate_limits.create_index([('expires_at', 1)], name='expires_at_ttl')
+
+        async def drop_index(self, name):
+            raise RuntimeError('not allowed')
+
+        monkeypatch.setattr(type(db.rate_limits), 'drop_index', drop_index)
+        await server.ensure_indexes()
+        return await db.rate_limits.index_information(), await db.outbox.index_information()
+
+    rate_limits, outbox = run(scenario())
+    assert 'expireAfterSeconds' not in rate_limits['expires_at_ttl']
+    assert 'status_available_at' in outbox
+    assert server.unique_indexes_ready is True
+
+
+# ==================== RATE LIMITING ====================
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_request(host='203.0.113.7'):
+    return Request({'type': 'http', 'client': (host, 1234), 'headers': []})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(server, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setattr(server, 'RATE_LIMIT_IP_ENABLED', True)
+    monkeypatch.setattr(server, 'RATE_LIMIT_SYNC_SECONDS', 0)
+    monkeypatch.setattr(server.time, 'monotonic', clock)
+    return clock
+
+
+def test_rate_limiter_rejects_with_retry_after(clock):
+    limiter = server.RateLimiter({'login': [('ip', 2, 6)]}, 100, 1)
+    limiter.check('login', make_request())
+    limiter.check('login', make_request())
+    with pytest.raises(HTTPException) as excinfo:
+        limiter.check('login', make_request())
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.headers['Retry-After'] == '10'  # 6 per minute
+
+
+def test_rate_limiter_refills_over_time(clock):
+    limiter = server.RateLimiter({'login': [('ip', 2, 6)]}, 100, 1)
+    for _ in range(2):
+        limiter.check('login', make_request())
+    clock.now += 10
+    limiter.check('login', make_request())
+    with pytest.raises(HTTPException):
+        limiter.check('login', make_request())
+
+
+def test_rate_limiter_keeps_identities_apart(clock):
+    limiter = server.RateLimiter({'login': [('ip', 1, 6), ('email', 1, 6)]}, 100, 1)
+    limiter.check('login', make_request(), email='a@example.com')
+    limiter.check('login', make_request('198.51.100.1'), email='b@example.com')
+    with pytest.raises(HTTPException):
+        limiter.check('login', make_request('198.51.100.2'), email='a@example.com')
+
+
+
+def test_rate_limiter_skips_ip_limits_until_proxies_are_trusted(clock, monkeypatch):
+    monkeypatch.setattr(server, 'RATE_LIMIT_IP_ENABLED', False)
+    limiter = server.RateLimiter({'login': [('ip', 1, 6), ('email', 1, 6)]}, 100, 1)
+    limiter.check('login', make_request(), email='a@example.com')
+    limiter.check('login', make_request(), email='b@example.com')
+    with pytest.raises(HTTPException):
+        limiter.check('login', make_request(), email='a@example.com')
+
+# ==================== USER CACHE ====================
+
+def test_user_cache_round_trip():
+    cache = server.UserCache(10, 30)
+    cache.set('u1', {'name': 'A'}, cache.epoch('u1'))
+    assert cache.get('u1') == {'name': 'A'}
+
+
+def test_user_cache_drops_a_read_that_raced_an_invalidation():
+    cache = server.UserCache(10, 30)
+    epoch = cache.epoch('u1')  # read started
+    cache.invalidate('u1')  # a write landed meanwhile
+    cache.set('u1', {'name': 'stale'}, epoch)
+    assert cache.get('u1') is None
+
+
+def test_user_cache_keeps_a_read_when_another_user_is_invalidated():
+    cache = server.UserCache(10, 30)
+    epoch = cache.epoch('u1')
+    cache.invalidate('u2')
+    cache.set('u1', {'name': 'A'}, epoch)
+    assert cache.get('u1') == {'name': 'A'}
+
+
+def test_user_cache_drops_a_raced_read_after_its_generation_is_evicted():
+    cache = server.UserCache(1, 30)
+    epoch = cache.epoch('u1')
+    cache.invalidate('u1')
+    cache.invalidate('u2')  # pushes u1's generation out
+    cache.set('u1', {'name': 'stale'}, epoch)
+    assert cache.get('u1') is None
+
+def test_user_cache_invalidate_drops_the_entry():
+    cache = server.UserCache(10, 30)
+    cache.set('u1', {'name': 'A'}, cache.epoch('u1'))
+    cache.invalidate('u1')
+    assert cache.get('u1') is None
+
+
+def test_user_cache_expires_entries(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(server.time, 'monotonic', clock)
+    cache = server.UserCache(10, 30)
+    cache.set('u1', {'name': 'A'}, cache.epoch('u1'))
+    clock.now += 31
+    assert cache.get('u1') is None
+
+
+def test_user_cache_evicts_least_recently_used():
+    cache = server.UserCache(2, 30)
+    for user_id in ('u1', 'u2'):
+        cache.set(user_id, {}, cache.epoch(user_id))
+    cache.get('u1')
+    cache.set('u3', {}, cache.epoch('u3'))
+    assert cache.get('u2') is None and cache.get('u1') == {}
+
+
+# ==================== CURSORS ====================
+
+def test_reminder_cursor_round_trip():
+    reminder = {'_id': ObjectId(), 'next_fire_at': datetime(2030, 1, 1, 9, 30, 15, 123000)}
+    cursor = server.encode_reminder_cursor(reminder)
+    assert server.decode_reminder_cursor(cursor) == (reminder['next_fire_at'], reminder['_id'])
+
+
+def test_reminder_cursor_of_a_legacy_reminder_uses_date_time():
+    reminder = {'_id': ObjectId(), 'date_time': datetime(2030, 1, 1, 9, 30)}
+    cursor = server.encode_reminder_cursor(reminder)
+    assert server.decode_reminder_cursor(cursor) == (reminder['date_time'], reminder['_id'])
+
+
+def test_invalid_reminder_cursor_is_a_400():
+    with pytest.raises(HTTPException) as excinfo:
+        server.decode_reminder_cursor('not-a-cursor')
+    assert excinfo.value.status_code == 400
+
+
+# ==================== OUTBOX ====================
+
+async def insert_deleted_reminder(db, user_id):
+    reminder_id = ObjectId()
+    await db.reminders.insert_one({
+        '_id': reminder_id, 'user_id': user_id, 'status': 'deleted', 'quota_released': False, 'version': 1
+    })
+    return str(reminder_id)
+
+
+def test_reminder_deleted_redelivery_releases_quota_once(db):
+    async def scenario():
+        user_id = await insert_user(db, reminder_count=3, change_version=1)
+        reminder_id = await insert_deleted_reminder(db, user_id)
+        for _ in range(3):
+            await server.release_deleted_reminder(user_id, reminder_id)
+        user = await get_user(db, user_id)
+        reminder = await db.reminders.find_one({'_id': ObjectId(reminder_id)})
+        return user, reminder
+
+    user, reminder = run(scenario())
+    assert user['reminder_count'] == 2
+    assert reminder['quota_released'] is True
+    assert reminder['version'] == user['change_version'] == 2
+
+
+def test_reminder_deleted_retries_until_the_delete_lands(db):
+    async def scenario():
+        user_id = await insert_user(db, reminder_count=1)
+        reminder_id = ObjectId()
+        await db.reminders.insert_one({'_id': reminder_id, 'user_id': user_id, 'status': 'active'})
+        with pytest.raises(LookupError):
+            await server.release_deleted_reminder(user_id, str(reminder_id))
+        return await get_user(db, user_id)
+
+    assert run(scenario())['reminder_count'] == 1
+
+
+def test_reminder_deleted_of_another_user_releases_nothing(db):
+    async def scenario():
+        owner_id = await insert_user(db, reminder_count=5)
+        other_id = await insert_user(db, reminder_count=5)
+        reminder_id = await insert_deleted_reminder(db, owner_id)
+        await server.release_deleted_reminder(other_id, reminder_id)
+        await server.release_deleted_reminder(owner_id, reminder_id)
+        return await get_user(db, owner_id), await get_user(db, other_id)
+
+    owner, other = run(scenario())
+    assert (owner['reminder_count'], other['reminder_count']) == (4, 5)
+
+
+def test_referral_redelivery_counts_once(db):
+    async def scenario():
+        referrer_id = await insert_user(db, referral_code='ABCD1234')
+        user_id = await insert_user(db)
+        for _ in range(3):
+            await server.apply_referral(user_id, 'ABCD1234')
+        return await get_user(db, referrer_id), await get_user(db, user_id)
+
+    referrer, user = run(scenario())
+    assert referrer['referral_count'] == 1
+    assert user['referred_by'] == str(referrer['_id'])
+
+
+def test_referral_counted_on_retry_after_a_failed_delivery(db, monkeypatch):
+    async def fail(*args):
+        raise ConnectionError("lost the primary")
+
+    async def scenario():
+        referrer_id = await insert_user(db, referral_code='ABCD1234')
+        user_id = await insert_user(db)
+        with monkeypatch.context() as patch:
+            patch.setattr(server, 'check_and_reward_referrer', fail)
+            with pytest.raises(ConnectionError):
+                await server.apply_referral(user_id, 'ABCD1234')
+        await server.apply_referral(user_id, 'ABCD1234')
+        return await get_user(db, referrer_id)
+
+    assert run(scenario())['referral_count'] == 1
+
+
+def test_referral_redelivery_gives_a_missed_reward(db):
+    async def scenario():
+        user_id = await insert_user(db)
+        referrer_id = await insert_user(
+            db, referral_code='ABCD1234', referral_count=server.REFERRAL_REWARD_THRESHOLD,
+            counted_referrals=[user_id]
+        )
+        await db.users.update_one({'_id': ObjectId(user_id)}, {'$set': {'referred_by': referrer_id}})
+        await server.apply_referral(user_id, 'ABCD1234')
+        return await get_user(db, referrer_id)
+
+    referrer = run(scenario())
+    assert referrer['referral_count'] == server.REFERRAL_REWARD_THRESHOLD
+    assert referrer['plan_type'] == 'premium'
+
+
+def test_referral_retries_until_the_user_is_inserted(db):
+    async def scenario():
+        await insert_user(db, referral_code='ABCD1234')
+        with pytest.raises(LookupError):
+            await server.apply_referral(str(ObjectId()), 'ABCD1234')
+
+    run(scenario())
+
+
+# ==================== FREE PLAN LIMIT ====================
+
+def test_free_plan_reservation_stops_at_the_limit(db):
+    async def scenario():
+        user_id = await insert_user(db, reminder_count=server.FREE_REMINDER_LIMIT - 1)
+        await server.reserve_reminder_quota(user_id, 1)
+        with pytest.raises(HTTPException) as excinfo:
+            await server.reserve_reminder_quota(user_id, 1)
+        return excinfo.value, await get_user(db, user_id)
+
+    error, user = run(scenario())
+    assert error.status_code == 403
+    assert user['reminder_count'] == server.FREE_REMINDER_LIMIT
+
+
+def test_free_plan_batch_reservation_is_all_or_nothing(db):
+    async def scenario():
+        user_id = await insert_user(db, reminder_count=3)
+        with pytest.raises(HTTPException):
+            await server.reserve_reminder_quota(user_id, 3)
+        return await get_user(db, user_id)
+
+    assert run(scenario())['reminder_count'] == 3
+
+
+def test_parallel_reservations_do_not_overshoot(db):
+    async def scenario():
+        user_id = await insert_user(db)
+        results = await asyncio.gather(
+            *(server.reserve_reminder_quota(user_id, 1) for _ in range(10)),
+            return_exceptions=True
+        )
+        return results, await get_user(db, user_id)
+
+    results, user = run(scenario())
+    assert sum(not isinstance(r, Exception) for r in results) == server.FREE_REMINDER_LIMIT
+    assert user['reminder_count'] == server.FREE_REMINDER_LIMIT
+
+
+def test_pending_deletes_are_applied_before_refusing(db):
+    async def scenario():
+        user_id = await insert_user(db, reminder_count=server.FREE_REMINDER_LIMIT)
+        reminder_id = await insert_deleted_reminder(db, user_id)
+        await db.outbox.insert_one({
+            'kind': 'reminder_deleted', 'status': 'pending',
+            'payload': {'user_id': user_id, 'reminder_id': reminder_id}
+        })
+        await server.reserve_reminder_quota(user_id, 1)
+        return await get_user(db, user_id), await db.outbox.count_documents({})
+
+    user, pending = run(scenario())
+    assert user['reminder_count'] == server.FREE_REMINDER_LIMIT
+    assert pending == 0
+
+
+def test_expired_premium_counts_as_free(db):
+    async def scenario():
+        user_id = await insert_user(
+            db, plan_type='premium', plan_expiry=datetime.utcnow() - timedelta(days=1),
+            reminder_count=server.FREE_REMINDER_LIMIT
+        )
+        with pytest.raises(HTTPException) as excinfo:
+            await server.reserve_reminder_quota(user_id, 1)
+        return excinfo.value
+
+    assert 'Premium plan expired' in run(scenario()).detail
+
+
+def test_premium_has_no_limit(db):
+    async def scenario():
+        user_id = await insert_user(
+            db, plan_type='premium', plan_expiry=datetime.utcnow() + timedelta(days=1),
+            reminder_count=100
+        )
+        return await server.reserve_reminder_quota(user_id, 10)
+
+    assert run(scenario()) == 10
+
+
+# ==================== SCHEDULER ====================
+
+def scheduled_reminder(date_time, **fields):
+    return {
+        '_id': ObjectId(), 'user_id': 'u1', 'name_to_call': 'Mom', 'phone_number': '+15550100',
+        'description': '', 'date_time': date_time, 'next_fire_at': date_time, 'recurrence': None,
+        'status': 'active', 'created_at': datetime.utcnow(), 'updated_at': datetime.utcnow(), **fields
+    }
+
+
+def test_scheduler_fires_reminders_entering_the_lookahead(scheduler):
+    now = datetime.utcnow()
+    fired = []
+    scheduler.add_listener(lambda user_id, payload: fired.append(payload['id']))
+    soon = scheduled_reminder(now + timedelta(seconds=30))
+    later = scheduled_reminder(now + timedelta(hours=2))
+    scheduler.add(later)
+    scheduler.add(soon)
+    scheduler._fire_due(now)
+    assert fired == [str(soon['_id'])]
+    assert [p['id'] for p in scheduler.due_for('u1', now)] == [str(soon['_id'])]
+
+
+def test_scheduler_drops_an_occurrence_once_it_has_passed(scheduler):
+    now = datetime.utcnow()
+    reminder = scheduled_reminder(now + timedelta(seconds=30))
+    scheduler.add(reminder)
+    scheduler._fire_due(now)
+    assert scheduler.due_for('u1', now + timedelta(minutes=1)) == []
+    assert scheduler.stats()['scheduled'] == 0
+
+
+def test_scheduler_puts_a_fired_series_back_at_its_next_occurrence(scheduler):
+    now = datetime.utcnow().replace(microsecond=0)
+    first = now + timedelta(seconds=30)
+    scheduler.add(scheduled_reminder(first, recurrence={'freq': 'daily', 'interval': 1}))
+    scheduler._fire_due(now)
+    assert len(scheduler.due_for('u1', now)) == 1
+    assert scheduler._heap[0][0] == first + timedelta(days=1)
+
+
+def test_scheduler_ignores_reminders_that_are_not_active(scheduler):
+    now = datetime.utcnow()
+    reminder = scheduled_reminder(now + timedelta(seconds=30))
+    scheduler.add(reminder)
+    scheduler.add(dict(reminder, status='completed'))
+    scheduler._fire_due(now)
+    assert scheduler.due_for('u1', now) == []
+
+
+def test_scheduler_reconcile_loads_active_reminders_within_the_horizon(db, scheduler):
+    async def scenario():
+        now = datetime.utcnow()
+        await db.reminders.insert_many([
+            scheduled_reminder(now + timedelta(hours=1)),
+            scheduled_reminder(now + timedelta(hours=1), status='completed'),
+            scheduled_reminder(now + server.SCHEDULER_HORIZON + timedelta(hours=1)),
+        ])
+        await scheduler.reconcile()
+
+    run(scenario())
+    assert scheduler.ready
+    assert scheduler.stats()['scheduled'] == 1
+
+
+def test_scheduler_sync_applies_writes_from_other_workers(db, scheduler):
+    async def scenario():
+        now = datetime.utcnow()
+        completed = scheduled_reminder(now + timedelta(hours=1))
+        await db.reminders.insert_one(completed)
+        await scheduler.reconcile()
+        created = scheduled_reminder(now + timedelta(hours=2))
+        await db.reminders.insert_one(created)
+        await db.reminders.update_one(
+            {'_id': completed['_id']},
+            {'$set': {'status': 'completed', 'updated_at': completed['updated_at'] + timedelta(seconds=1)}}
+        )
+        changed = await scheduler.sync()
+        return changed, str(created['_id'])
+
+    changed, created_id = run(scenario())
+    assert changed == 2
+    assert list(scheduler._entries) == [created_id]
+
+
+# ==================== CHANGES ====================
+
+async def insert_changes(db, user_id, *changes):
+    """Insert (version, status, age in seconds) reminders of a user"""
+    now = datetime.utcnow()
+    for version, status, age in changes:
+        await db.reminders.insert_one(scheduled_reminder(
+            now, user_id=user_id, version=version, status=status, updated_at=now - timedelta(seconds=age)
+        ))
+
+
+async def fetch_changes(user_id, since, limit=server.CHANGES_PAGE_MAX):
+    response = await server.get_reminder_changes(since, limit, {'_id': ObjectId(user_id)})
+    return orjson.loads(response.body)
+
+
+def test_changes_without_since_start_from_the_settled_version(db):
+    user_id = str(ObjectId())
+
+    async def scenario():
+        await insert_changes(db, user_id, (1, 'active', 60), (2, 'active', 60), (3, 'active', 0))
+        return await server.get_reminder_changes(None, server.CHANGES_PAGE_MAX, {'_id': ObjectId(user_id)})
+
+    assert run(scenario()) == {'reset': True, 'version': 2, 'changes': [], 'deleted': [], 'has_more': False}
+
+
+def test_changes_list_updates_and_tombstones_since_a_version(db):
+    user_id = str(ObjectId())
+
+    async def scenario():
+        await insert_changes(db, user_id, (1, 'active', 60), (2, 'completed', 60), (3, 'deleted', 60))
+        return await fetch_changes(user_id, 1)
+
+    changes = run(scenario())
+    assert changes['version'] == 3
+    assert [c['status'] for c in changes['changes']] == ['completed']
+    assert len(changes['deleted']) == 1
+    assert changes['has_more'] is False
+
+
+def test_changes_stop_the_version_before_an_unsettled_change(db):
+    user_id = str(ObjectId())
+
+    async def scenario():
+        await insert_changes(db, user_id, (1, 'active', 60), (2, 'active', 0), (3, 'active', 60))
+        return await fetch_changes(user_id, 0, limit=2)
+
+    changes = run(scenario())
+    assert len(changes['changes']) == 2  # sent now, and again next time
+    assert changes['version'] == 1
+    assert changes['has_more'] is False
+
+
+def test_changes_page_through_settled_versions(db):
+    user_id = str(ObjectId())
+
+    async def scenario():
+        await insert_changes(db, user_id, *((v, 'active', 60) for v in range(1, 4)))
+        first = await fetch_changes(user_id, 0, limit=2)
+        second = await fetch_changes(user_id, first['version'], limit=2)
+        return first, second
+
+    first, second = run(scenario())
+    assert (first['version'], first['has_more']) == (2, True)
+    assert (second['version'], second['has_more']) == (3, False)
+
+
+# ==================== SNOOZE AND RESCHEDULE ====================
+
+async def insert_reminder(db, user_id, **fields):
+    reminder = scheduled_reminder(datetime.utcnow() - timedelta(minutes=5), user_id=user_id, version=0, **fields)
+    await db.reminders.insert_one(reminder)
+    return str(reminder['_id'])
+
+
+def test_snooze_moves_a_one_off_reminder(db, scheduler):
+    async def scenario():
+        user_id = await insert_user(db)
+        reminder_id = await insert_reminder(db, user_id, status='triggered')
+        before = datetime.utcnow().replace(microsecond=0)
+        await server.snooze_reminder(reminder_id, 10, await get_user(db, user_id))
+        return before, await db.reminders.find_one({'_id': ObjectId(reminder_id)})
+
+    before, reminder = run(scenario())
+    assert reminder['status'] == 'active'
+    assert reminder['date_time'] == reminder['next_fire_at'] >= before + timedelta(minutes=10)
+    assert reminder['snoozed_until'] is None
+    assert reminder['version'] == 1
+    assert scheduler.stats()['scheduled'] == 1
+
+
+def test_snooze_keeps_the_rule_of_a_series(db, scheduler):
+    async def scenario():
+        user_id = await insert_user(db)
+        reminder_id = await insert_reminder(db, user_id, recurrence={'freq': 'daily', 'interval': 1}, recurring=True)
+        stored = await db.reminders.find_one({'_id': ObjectId(reminder_id)})
+        await server.snooze_reminder(reminder_id, 10, await get_user(db, user_id))
+        return stored, await db.reminders.find_one({'_id': ObjectId(reminder_id)})
+
+    stored, reminder = run(scenario())
+    assert reminder['date_time'] == stored['date_time']
+    assert reminder['next_fire_at'] == reminder['snoozed_until'] > datetime.utcnow()
+    assert reminder['recurring'] is True
+
+
+def test_reschedule_reads_a_wall_clock_time_in_the_stored_timezone(db, scheduler):
+    async def scenario():
+        user_id = await insert_user(db)
+        reminder_id = await insert_reminder(db, user_id, timezone='Asia/Kolkata', status='completed')
+        data = server.ReminderReschedule(date_time=datetime(2030, 1, 1, 9, 0))
+        await server.reschedule_reminder(reminder_id, data, await get_user(db, user_id))
+        return await db.reminders.find_one({'_id': ObjectId(reminder_id)})
+
+    reminder = run(scenario())
+    assert reminder['date_time'] == reminder['next_fire_at'] == datetime(2030, 1, 1, 3, 30)
+    assert reminder['timezone'] == 'Asia/Kolkata'
+    assert reminder['status'] == 'active'
+
+
+def test_reschedule_of_another_users_reminder_is_a_404(db, scheduler):
+    async def scenario():
+        owner_id = await insert_user(db)
+        reminder_id = await insert_reminder(db, owner_id)
+        other = await get_user(db, await insert_user(db))
+        data = server.ReminderReschedule(date_time=datetime(2030, 1, 1, 9, 0), timezone=None)
+        with pytest.raises(HTTPException) as excinfo:
+            await server.reschedule_reminder(reminder_id, data, other)
+        return excinfo.value
+
+    assert run(scenario()).status_code == 404
+
+
+# ==================== BATCHES ====================
+
+def reminder_create(**fields):
+    return server.ReminderCreate(**{
+        'name_to_call': 'Mom', 'phone_number': '+15550100',
+        'date_time': datetime.utcnow() + timedelta(minutes=1), **fields
+    })
+
+
+@pytest.mark.parametrize('size', [0, server.REMINDER_BATCH_MAX + 1])
+def test_batch_size_is_validated_by_the_models(size):
+    with pytest.raises(ValidationError):
+        server.ReminderBatchCreate(reminders=[reminder_create() for _ in range(size)])
+    with pytest.raises(ValidationError):
+        server.ReminderBatchIds(ids=['000000000000000000000000'] * size)
+
+
+def test_batch_create_schedules_every_reminder(db, scheduler):
+    async def scenario():
+        user_id = await insert_user(db)
+        batch = server.ReminderBatchCreate(reminders=[reminder_create() for _ in range(3)])
+        response = await server.batch_create_reminders(batch, await get_user(db, user_id))
+        versions = [r['version'] async for r in db.reminders.find({}).sort('version', 1)]
+        return response, versions, await get_user(db, user_id)
+
+    response, versions, user = run(scenario())
+    assert [r['status'] for r in response['results']] == ['created'] * 3
+    assert versions == [1, 2, 3]
+    assert user['reminder_count'] == 3
+    assert scheduler.stats()['scheduled'] == 3
+
+
+def test_batch_create_releases_only_the_quota_of_reminders_not_inserted(db, scheduler, monkeypatch):
+    async def insert_many(self, docs, *args, **kwargs):
+        await self.insert_one(docs[0])
+        raise BulkWriteError({'nInserted': 1, 'writeErrors': [{'index': 1, 'code': 11000, 'errmsg': 'duplicate'}]})
+
+    async def scenario():
+        user_id = await insert_user(db)
+        monkeypatch.setattr(type(db.reminders), 'insert_many', insert_many)
+        batch = server.ReminderBatchCreate(reminders=[reminder_create() for _ in range(3)])
+        response = await server.batch_create_reminders(batch, await get_user(db, user_id))
+        return response, await get_user(db, user_id), await db.reminders.count_documents({})
+
+    response, user, stored = run(scenario())
+    assert [r['status'] for r in response['results']] == ['created', 'failed', 'failed']
+    assert user['reminder_count'] == stored == 1
+    assert scheduler.stats()['scheduled'] == 1
+
+
+@pytest.mark.parametrize('status', ['completed', 'deleted'])
+def test_batch_status_change_reports_each_id(db, scheduler, status):
+    async def scenario():
+        user_id = await insert_user(db)
+        user = await get_user(db, user_id)
+        batch = server.ReminderBatchCreate(reminders=[reminder_create() for _ in range(2)])
+        created = await server.batch_create_reminders(batch, user)
+        ids = [r['reminder']['id'] for r in created['results']]
+        other = await db.reminders.insert_one({'user_id': 'someone-else', 'status': 'active'})
+        response = await server.apply_reminder_batch(user, [ids[0], str(other.inserted_id), 'not-an-id'], status)
+        return ids, response, await db.reminders.find_one({'_id': ObjectId(ids[0])})
+
+    ids, response, reminder = run(scenario())
+    assert [r['status'] for r in response['results']] == [status, 'not_found', 'not_found']
+    assert reminder['status'] == status
+    assert scheduler.stats()['scheduled'] == 1
+
+
+# ==================== PUSH ====================
+
+@pytest.mark.parametrize('enabled', [True, False])
+def test_device_registration_says_whether_pushes_are_sent(db, monkeypatch, enabled):
+    monkeypatch.setattr(server, 'PUSH_ENABLED', enabled)
+    data = server.DeviceTokenRegister(token='ExponentPushToken[abc]', platform='android')
+    result = run(server.register_device(data, {'user_id': 'u1'}))
+    assert result['push'] is enabled
+
+
+def push_dispatcher(handler):
+    dispatcher = server.PushDispatcher('https://push.test/send', 1, 10)
+    dispatcher._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return dispatcher
+
+
+def push_tickets(*statuses):
+    return {'data': [
+        {'status': 'ok'} if status == 'ok' else {'status': 'error', 'details': {'error': status}}
+        for status in statuses
+    ]}
+
+
+async def insert_device(db, user_id, token):
+    await db.device_tokens.insert_one({'_id': token, 'user_id': user_id})
+
+
+def test_push_is_claimed_by_one_worker_only(db):
+    sent = []
+
+    def handler(request):
+        messages = json.loads(request.content)
+        sent.extend(message['to'] for message in messages)
+        return httpx.Response(200, json=push_tickets(*['ok'] * len(messages)))
+
+    async def scenario():
+        await insert_device(db, 'u1', 'ExponentPushToken[a]')
+        payload = server.reminder_check_payload(scheduled_reminder(datetime(2030, 1, 1, 9, 0)))
+        for worker in (push_dispatcher(handler), push_dispatcher(handler)):
+            await worker.dispatch([(time.monotonic(), 'u1', payload), (time.monotonic(), 'u1', payload)])
+
+    run(scenario())
+    assert sent == ['ExponentPushToken[a]']
+
+
+def test_push_retries_throttled_calls_and_messages(db):
+    calls = []
+
+    def handler(request):
+        messages = json.loads(request.content)
+        calls.append([message['to'] for message in messages])
+        if len(calls) == 1:
+            return httpx.Response(429, headers={'Retry-After': '0'})
+        if len(calls) == 2:
+            return httpx.Response(200, json=push_tickets('ok', 'MessageRateExceeded'))
+        return httpx.Response(200, json=push_tickets(*['ok'] * len(messages)))
+
+    async def scenario():
+        await insert_device(db, 'u1', 'ExponentPushToken[a]')
+        await insert_device(db, 'u1', 'ExponentPushToken[b]')
+        dispatcher = push_dispatcher(handler)
+        payload = server.reminder_check_payload(scheduled_reminder(datetime(2030, 1, 1, 9, 0)))
+        await dispatcher.dispatch([(time.monotonic(), 'u1', payload)])
+        return dispatcher
+
+    dispatcher = run(scenario())
+    assert len(calls) == 3 and len(calls[2]) == 1
+    assert (dispatcher.sent, dispatcher.failed) == (2, 0)
+
+
+def test_push_gives_up_after_the_last_retry(db, monkeypatch):
+    monkeypatch.setattr(server, 'PUSH_MAX_RETRIES', 2)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503, headers={'Retry-After': '0'})
+
+    async def scenario():
+        await insert_device(db, 'u1', 'ExponentPushToken[a]')
+        dispatcher = push_dispatcher(handler)
+        payload = server.reminder_check_payload(scheduled_reminder(datetime(2030, 1, 1, 9, 0)))
+        await dispatcher.dispatch([(time.monotonic(), 'u1', payload)])
+        return dispatcher
+
+    dispatcher = run(scenario())
+    assert len(calls) == 3
+    assert (dispatcher.sent, dispatcher.failed) == (0, 1)
+
+
+def test_push_forgets_devices_that_are_not_registered(db):
+    def handler(request):
+        return httpx.Response(200, json=push_tickets('DeviceNotRegistered'))
+
+    async def scenario():
+        await insert_device(db, 'u1', 'ExponentPushToken[a]')
+        dispatcher = push_dispatcher(handler)
+        payload = server.reminder_check_payload(scheduled_reminder(datetime(2030, 1, 1, 9, 0)))
+        await dispatcher.dispatch([(time.monotonic(), 'u1', payload)])
+        return dispatcher, await db.device_tokens.count_documents({})
+
+    dispatcher, devices = run(scenario())
+    assert dispatcher.pruned == 1
+    assert devices == 0
+
+
+# ==================== STREAM ====================
+
+@pytest.fixture
+def stream(db, scheduler, monkeypatch):
+    monkeypatch.setattr(server, 'STREAM_HEARTBEAT_SECONDS', 0.01)
+    monkeypatch.setattr(server, 'stream_hub', server.ReminderStreamHub(2))
+    monkeypatch.setattr(server, 'revocation_list', server.TokenRevocationList())
+    claims = server.decode_token(server.create_access_token({'_id': ObjectId()}), 'access')
+    return claims, server.stream_hub
+
+
+async def stream_events(claims):
+    response = await server.stream_reminders(claims)
+    return response.body_iterator
+
+
+def test_stream_ends_once_its_token_is_revoked(stream):
+    claims, _ = stream
+
+    async def scenario():
+        events = await stream_events(claims)
+        received = [await anext(events), await anext(events)]
+        await server.revocation_list.revoke(claims['jti'], claims['user_id'], datetime.utcnow() + timedelta(minutes=1))
+        with pytest.raises(StopAsyncIteration):
+            await anext(events)
+        return received
+
+    assert run(scenario()) == [server.sse_event('reminders', []), ': heartbeat\n\n']
+
+
+def test_stream_ends_once_its_token_expires(stream):
+    claims, _ = stream
+    claims['exp'] = time.time() - 1
+
+    async def scenario():
+        events = await stream_events(claims)
+        await anext(events)
+        with pytest.raises(StopAsyncIteration):
+            await anext(events)
+
+    run(scenario())
+
+
+def test_overflowed_stream_sends_what_was_queued_before_closing(stream):
+    claims, hub = stream
+    user_id = claims['user_id']
+
+    async def scenario():
+        events = await stream_events(claims)
+        await anext(events)
+        for n in range(3):  # the third overflows the queue of 2
+            hub.publish(user_id, {'n': n})
+        first = await anext(events)
+        hub.publish(user_id, {'n': 3})  # lands while the batch is being sent
+        second = await anext(events)
+        with pytest.raises(StopAsyncIteration):
+            await anext(events)
+        return first, second
+
+    first, second = run(scenario())
+    assert first == server.sse_event('reminders', [{'n': 0}, {'n': 1}])
+    assert second == server.sse_event('reminders', [{'n': 3}])
+
+
+# ==================== TOKENS ====================
+
+@pytest.fixture
+def revocations(db, monkeypatch):
+    revocation_list = server.TokenRevocationList()
+    monkeypatch.setattr(server, 'revocation_list', revocation_list)
+    return revocation_list
+
+
+def test_plan_status_is_served_from_the_token_alone(db):
+    user = {'_id': ObjectId(), 'plan_type': 'premium', 'plan_expiry': datetime(2030, 1, 1), 'reminder_count': 7}
+    claims = server.decode_token(server.create_access_token(user), 'access')
+    assert run(server.get_plan_status(claims)) == {
+        'plan_type': 'premium', 'plan_expiry': '2030-01-01T00:00:00', 'reminder_count': 7
+    }
+
+
+def test_refresh_token_is_single_use(db, revocations):
+    async def scenario():
+        user_id = await insert_user(db, plan_type='premium', plan_expiry=datetime(2030, 1, 1))
+        refresh_token = server.create_refresh_token(user_id)
+        tokens = await server.refresh_tokens(server.RefreshRequest(refresh_token=refresh_token))
+        with pytest.raises(HTTPException) as excinfo:
+            await server.refresh_tokens(server.RefreshRequest(refresh_token=refresh_token))
+        return tokens, excinfo.value
+
+    tokens, replay = run(scenario())
+    assert server.decode_token(tokens['token'], 'access')['plan_type'] == 'premium'
+    assert (replay.status_code, replay.detail) == (401, "Token revoked")
+
+
+def test_refresh_token_is_not_an_access_token(revocations):
+    refresh_token = server.create_refresh_token(str(ObjectId()))
+    with pytest.raises(HTTPException) as excinfo:
+        run(server.get_token_claims(f'Bearer {refresh_token}'))
+    assert excinfo.value.status_code == 401
+
+
+def test_logout_revokes_both_tokens(db, revocations):
+    async def scenario():
+        user_id = await insert_user(db)
+        tokens = server.issue_tokens(await get_user(db, user_id))
+        claims = await server.get_token_claims(f"Bearer {tokens['token']}")
+        await server.logout(server.LogoutRequest(refresh_token=tokens['refresh_token']), claims)
+        return tokens
+
+    tokens = run(scenario())
+    for token, token_type in ((tokens['token'], 'access'), (tokens['refresh_token'], 'refresh')):
+        with pytest.raises(HTTPException):
+            server.decode_token(token, token_type)
+
+
+def test_revocations_reach_other_workers_on_sync(db, revocations):
+    token = server.create_access_token({'_id': ObjectId()})
+    claims = server.decode_token(token, 'access')
+
+    async def scenario():
+        await revocations.revoke(claims['jti'], claims['user_id'], datetime.utcnow() + timedelta(minutes=1))
+        other_worker = server.TokenRevocationList()
+        await other_worker.sync()
+        return other_worker
+
+    assert run(scenario()).is_revoked(claims['jti'])
+
+
+def test_plan_change_outdates_earlier_access_tokens(db, revocations):
+    user = {'_id': ObjectId(), 'plan_version': 1}
+    earlier = server.create_access_token(user)
+    run(revocations.outdate_plan_claims({str(user['_id']): 2}))
+    with pytest.raises(HTTPException) as excinfo:
+        server.decode_token(earlier, 'access')
+    assert excinfo.value.detail == "Token outdated"
+    assert server.decode_token(server.create_access_token(dict(user, plan_version=2)), 'access')